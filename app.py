@@ -1,56 +1,202 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory, send_file, redirect, url_for
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, send_from_directory, send_file, redirect, url_for
+from flask.cli import with_appcontext
 from models import (
     db, TestCase, Step, TestCaseComment, Attachment, TestCaseTemplate, 
     TemplateStep, TestRun, TestCaseExecution, TestCaseVersion, VersionStep,
-    TestStatus, Priority
+    TestStatus, Priority, Job
+)
+from jobs import job_handler, schedule_job, submit_job, cancel_job, job_to_dict, start_worker
+import serializers
+from serializers import serialize
+import relations
+import versions
+import archive
+import duplicates
+import changes
+from database import (
+    database_url, engine_options, insert_from_select, add_missing_columns, missing_columns,
+    stale_foreign_keys, upgrade_foreign_keys
 )
-from docx import Document
 import os
+import io
+import re
+import csv
 import json
-from datetime import datetime
-import pandas as pd
+from datetime import date, datetime, timedelta
+from sqlalchemy import insert, literal, select
 from werkzeug.utils import secure_filename
 import uuid
+import click
 
-app = Flask(__name__, instance_relative_config=True)
+# pandas (and openpyxl through it) and python-docx are imported inside the
+# import/export functions: they cost hundreds of milliseconds and tens of MB
+# per process, and only those routes need them.
 
-# Ensure instance folder exists
 INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance')
-if not os.path.exists(INSTANCE_PATH):
-    os.makedirs(INSTANCE_PATH)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(INSTANCE_PATH, "database.db").replace(os.sep, "/")}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-db.init_app(app)
 
 UPLOAD_FOLDER = 'exports'
 ATTACHMENT_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}
 
-for folder in [UPLOAD_FOLDER, ATTACHMENT_FOLDER]:
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+bp = Blueprint('main', __name__)
+
+def create_app(config=None):
+    """Application factory.
+
+    Does not touch the database or start background threads, so it is safe
+    to call in the gunicorn master with ``--preload``. Run ``flask --app app
+    init-db`` once to create the schema.
+    """
+    app = Flask(__name__, instance_relative_config=True)
+    
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(INSTANCE_PATH)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['EXPORT_FOLDER'] = 'exports'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+    app.config['GRAPH_DEFAULT_DEPTH'] = int(os.environ.get('GRAPH_DEFAULT_DEPTH', 10))
+    app.config['GRAPH_MAX_DEPTH'] = int(os.environ.get('GRAPH_MAX_DEPTH', 50))
+    app.config['GRAPH_CACHE_TTL'] = float(os.environ.get('GRAPH_CACHE_TTL', 60))
+    app.config['GRAPH_CACHE_SIZE'] = int(os.environ.get('GRAPH_CACHE_SIZE', 256))
+    app.config['VERSIONS_PER_PAGE'] = int(os.environ.get('VERSIONS_PER_PAGE', 20))
+    app.config['VERSIONS_MAX_PER_PAGE'] = int(os.environ.get('VERSIONS_MAX_PER_PAGE', 100))
+    app.config['VERSION_DIFF_CACHE_SIZE'] = int(os.environ.get('VERSION_DIFF_CACHE_SIZE', 256))
+    app.config['VERSION_DIFF_CACHE_TTL'] = float(os.environ.get('VERSION_DIFF_CACHE_TTL', 24 * 3600))
+    app.config['JOB_FOLDER'] = os.path.join(INSTANCE_PATH, 'jobs')
+    app.config['JOB_WORKER_ENABLED'] = os.environ.get('JOB_WORKER_ENABLED', '1') == '1'
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+    app.config['JOB_RETENTION_HOURS'] = int(os.environ.get('JOB_RETENTION_HOURS', 24 * 7))
+    app.config['JOB_MAX_RETAINED'] = int(os.environ.get('JOB_MAX_RETAINED', 500))
+    app.config['JOB_BATCH_SIZE'] = int(os.environ.get('JOB_BATCH_SIZE', 500))
+    app.config['JOB_HEARTBEAT_TIMEOUT'] = float(os.environ.get('JOB_HEARTBEAT_TIMEOUT', 120))
+    app.config['ARCHIVE_FOLDER'] = os.environ.get('ARCHIVE_FOLDER', os.path.join(INSTANCE_PATH, 'archive'))
+    app.config['ARCHIVE_RETENTION_DAYS'] = int(os.environ.get('ARCHIVE_RETENTION_DAYS', 90))
+    app.config['ARCHIVE_BATCH_SIZE'] = int(os.environ.get('ARCHIVE_BATCH_SIZE', 5000))
+    app.config['ARCHIVE_INTERVAL_HOURS'] = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 24))
+    app.config['ARCHIVE_MAX_READ_DAYS'] = int(os.environ.get('ARCHIVE_MAX_READ_DAYS', 31))
+    app.config['DUPLICATE_THRESHOLD'] = float(os.environ.get('DUPLICATE_THRESHOLD', 0.8))
+    app.config['DUPLICATE_MAX_CLUSTERS'] = int(os.environ.get('DUPLICATE_MAX_CLUSTERS', 100))
+    app.config['DUPLICATE_MAX_BUCKET_SIZE'] = int(os.environ.get('DUPLICATE_MAX_BUCKET_SIZE', 50))
+    app.config['DUPLICATE_CACHE_TTL'] = float(os.environ.get('DUPLICATE_CACHE_TTL', 60))
+    app.config['DUPLICATE_CACHE_SIZE'] = int(os.environ.get('DUPLICATE_CACHE_SIZE', 32))
+    app.config['CHANGE_FEED_PAGE_SIZE'] = int(os.environ.get('CHANGE_FEED_PAGE_SIZE', 1000))
+    app.config['CHANGE_FEED_GAP_TIMEOUT'] = float(os.environ.get('CHANGE_FEED_GAP_TIMEOUT', 60))
+    app.config['CHANGE_LOG_RETENTION_HOURS'] = int(os.environ.get('CHANGE_LOG_RETENTION_HOURS', 24 * 7))
+    app.config['CHANGE_LOG_PRUNE_INTERVAL_HOURS'] = float(os.environ.get('CHANGE_LOG_PRUNE_INTERVAL_HOURS', 6))
+    if config:
+        app.config.update(config)
+    if app.config['ARCHIVE_RETENTION_DAYS'] < 1:
+        raise ValueError("ARCHIVE_RETENTION_DAYS must be at least 1")
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    
+    # Ensure instance and data folders exist
+    for folder in [INSTANCE_PATH, UPLOAD_FOLDER, ATTACHMENT_FOLDER, app.config['JOB_FOLDER'], app.config['ARCHIVE_FOLDER']]:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+    
+    db.init_app(app)
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(archive_executions_command)
+    app.cli.add_command(index_duplicates_command)
+    
+    # The job worker owns threads and a process pool, which do not survive
+    # a fork; start it lazily in whichever process serves requests.
+    @app.before_request
+    def ensure_job_worker():
+        check_schema(current_app._get_current_object())
+        start_worker(current_app._get_current_object())
+    
+    return app
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create any missing database tables and indexes."""
+    upgraded, added = init_db()
+    for table_name in upgraded:
+        click.echo(f'Updated foreign keys of {table_name}.')
+    for column_name in added:
+        click.echo(f'Added column {column_name}.')
+    click.echo('Database initialized.')
+
+def init_db():
+    """Bring the schema up to date.
+
+    Returns the tables whose foreign keys changed and the columns that were
+    added. Routes rely on ON DELETE rules (``passive_deletes``) and new
+    columns, neither of which ``create_all()`` adds to existing tables, so
+    every way of starting the app has to go through here.
+    """
+    upgraded = upgrade_foreign_keys(db.engine)
+    added = add_missing_columns(db.engine)
+    db.create_all()
+    # create_all() skips tables that already exist, including their indexes
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    return upgraded, added
+
+def check_schema(app):
+    """Refuse to serve requests against an outdated schema.
+
+    Outdated foreign keys make deletes fail with IntegrityError (SQLite)
+    or leave orphans behind; missing columns break every query on their
+    table. Checked once per process; a failed check is repeated
+    so the app recovers after ``init-db`` without a restart.
+    """
+    if app.extensions.get('schema_checked'):
+        return
+    stale = stale_foreign_keys(db.engine)
+    stale += [f'{table.name}.{column.name}' for table, column in missing_columns(db.engine)]
+    if stale:
+        raise RuntimeError(
+            f"Schema of {', '.join(stale)} is out of date; run `flask --app app init-db`."
+        )
+    app.extensions['schema_checked'] = True
+
+@click.command('archive-executions')
+@click.option('--days', type=click.IntRange(min=1), default=None, help='Retention window in days (default: ARCHIVE_RETENTION_DAYS).')
+@with_appcontext
+def archive_executions_command(days):
+    """Move executions older than the retention window to compressed archive files."""
+    result = archive.archive_executions(days)
+    click.echo(f"Archived {result['archived']} executions older than {result['cutoff']}.")
+
+@click.command('index-duplicates')
+@with_appcontext
+def index_duplicates_command():
+    """Rebuild the MinHash signatures used for near-duplicate detection."""
+    indexed = duplicates.reindex(current_app.config['JOB_BATCH_SIZE'])
+    click.echo(f"Indexed {indexed} test cases.")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-with app.app_context():
-    db.create_all()
+def wants_job():
+    """True when the client asked for the operation to run as a background job."""
+    flag = request.args.get('async', '') or request.form.get('async', '')
+    if not flag and request.is_json:
+        flag = str((request.get_json(silent=True) or {}).get('async', ''))
+    return flag.lower() in ('1', 'true', 'yes')
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 # --- FRONTEND ROUTES ---
-@app.route('/')
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 def dashboard():
     return render_template('index.html')  # Dashboard will be part of the main page
 
 # --- API: DASHBOARD/ANALYTICS ---
-@app.route('/api/dashboard', methods=['GET'])
+@bp.route('/api/dashboard', methods=['GET'])
 def get_dashboard_stats():
     total_cases = TestCase.query.count()
     status_counts = {}
@@ -79,7 +225,7 @@ def get_dashboard_stats():
     })
 
 # --- API: TEST CASES ---
-@app.route('/api/testcases', methods=['GET'])
+@bp.route('/api/testcases', methods=['GET'])
 def get_test_cases():
     # Filtering and searching
     search = request.args.get('search', '')
@@ -104,93 +250,15 @@ def get_test_cases():
     if tag_filter:
         query = query.filter(TestCase.tags.contains(tag_filter))
     
-    test_cases = query.order_by(TestCase.created_at.desc()).all()
-    
-    return jsonify([
-        {
-            "id": tc.id,
-            "name": tc.name,
-            "description": tc.description,
-            "precondition": tc.precondition or "",
-            "postcondition": tc.postcondition or "",
-            "comment": tc.comment or "",
-            "status": tc.status,
-            "priority": tc.priority,
-            "category": tc.category or "",
-            "tags": tc.tags or "",
-            "created_at": tc.created_at.isoformat() if tc.created_at else "",
-            "updated_at": tc.updated_at.isoformat() if tc.updated_at else "",
-            "steps": [
-                {
-                    "id": step.id,
-                    "description": step.description,
-                    "expected_result": step.expected_result,
-                    "actual_result": step.actual_result or "",
-                    "order": step.order
-                }
-                for step in sorted(tc.steps, key=lambda s: s.order)
-            ],
-            "comments_count": len(tc.comments),
-            "attachments_count": len(tc.attachments),
-            "related_to": tc.related_to
-        }
-        for tc in test_cases
-    ])
-
-@app.route('/api/testcases/<int:test_case_id>', methods=['GET'])
+    query = query.order_by(TestCase.created_at.desc())
+    return serialize(serializers.test_case_list(query))
+
+@bp.route('/api/testcases/<int:test_case_id>', methods=['GET'])
 def get_test_case(test_case_id):
     test_case = TestCase.query.get_or_404(test_case_id)
-    return jsonify({
-        "id": test_case.id,
-        "name": test_case.name,
-        "description": test_case.description,
-        "precondition": test_case.precondition or "",
-        "postcondition": test_case.postcondition or "",
-        "comment": test_case.comment or "",
-        "status": test_case.status,
-        "priority": test_case.priority,
-        "category": test_case.category or "",
-        "tags": test_case.tags or "",
-        "created_at": test_case.created_at.isoformat() if test_case.created_at else "",
-        "updated_at": test_case.updated_at.isoformat() if test_case.updated_at else "",
-        "steps": [
-            {
-                "id": step.id,
-                "description": step.description,
-                "expected_result": step.expected_result,
-                "actual_result": step.actual_result or "",
-                "order": step.order
-            }
-            for step in sorted(test_case.steps, key=lambda s: s.order)
-        ],
-        "comments": [
-            {
-                "id": comment.id,
-                "comment": comment.comment,
-                "created_at": comment.created_at.isoformat() if comment.created_at else ""
-            }
-            for comment in test_case.comments
-        ],
-        "attachments": [
-            {
-                "id": att.id,
-                "filename": att.filename,
-                "file_type": att.file_type,
-                "created_at": att.created_at.isoformat() if att.created_at else ""
-            }
-            for att in test_case.attachments
-        ],
-        "related_to": test_case.related_to,
-        "related_cases": [
-            {
-                "id": rel.id,
-                "name": rel.name
-            }
-            for rel in TestCase.query.filter_by(related_to=test_case.id).all()
-        ] if test_case.related_to else []
-    })
+    return serialize(serializers.test_case_detail(test_case))
 
-@app.route('/api/testcases', methods=['POST'])
+@bp.route('/api/testcases', methods=['POST'])
 def create_test_case():
     data = request.json
     
@@ -242,10 +310,14 @@ def create_test_case():
         )
         db.session.add(version_step)
     
+    duplicates.update_signatures([test_case.id])
+    changes.record(changes.TEST_CASE, changes.CREATED, [test_case.id])
     db.session.commit()
+    if test_case.related_to:
+        relations.invalidate()
     return jsonify({"message": "Test Case Created", "id": test_case.id}), 201
 
-@app.route('/api/testcases/<int:test_case_id>', methods=['PUT'])
+@bp.route('/api/testcases/<int:test_case_id>', methods=['PUT'])
 def update_test_case(test_case_id):
     test_case = TestCase.query.get_or_404(test_case_id)
     data = request.json
@@ -264,6 +336,7 @@ def update_test_case(test_case_id):
     test_case.priority = data.get('priority', test_case.priority)
     test_case.category = data.get('category', test_case.category)
     test_case.tags = data.get('tags', test_case.tags)
+    old_related_to = test_case.related_to
     test_case.related_to = data.get('related_to', test_case.related_to)
     test_case.updated_at = datetime.utcnow()
     
@@ -310,44 +383,100 @@ def update_test_case(test_case_id):
                 order=step.order
             )
             db.session.add(version_step)
+        duplicates.update_signatures([test_case.id])
     
+    changes.record(changes.TEST_CASE, changes.UPDATED, [test_case.id])
     db.session.commit()
+    if test_case.related_to != old_related_to:
+        relations.invalidate()
     return jsonify({"message": "Test Case Updated"}), 200
 
-@app.route('/api/testcases/<int:test_case_id>', methods=['DELETE'])
+@bp.route('/api/testcases/<int:test_case_id>', methods=['DELETE'])
 def delete_test_case(test_case_id):
     test_case = TestCase.query.get_or_404(test_case_id)
+    paths = attachment_paths([test_case_id])
+    record_case_deletes([test_case_id])
+    # Steps, comments, attachments, versions and executions go with ON DELETE CASCADE
     db.session.delete(test_case)
     db.session.commit()
+    relations.invalidate()
+    duplicates.invalidate()
+    remove_files_later(paths)
     return jsonify({"message": "Test Case Deleted"}), 200
 
-@app.route('/api/testcases/bulk', methods=['POST'])
-def bulk_operations():
-    data = request.json
+def record_case_deletes(test_case_ids):
+    """Log deleted cases, the cases whose ``related_to`` the delete will clear,
+    and the runs whose executions it cascades away.
+
+    Must run before the delete, while those rows can still be found.
+    """
+    changes.record(changes.TEST_CASE, changes.DELETED, test_case_ids)
+    children = (
+        db.session.query(TestCase.id)
+        .filter(TestCase.related_to.in_(test_case_ids), TestCase.id.notin_(test_case_ids))
+    )
+    changes.record(changes.TEST_CASE, changes.UPDATED, [case_id for (case_id,) in children])
+    runs = (
+        db.session.query(TestCaseExecution.test_run_id)
+        .filter(TestCaseExecution.test_case_id.in_(test_case_ids), TestCaseExecution.test_run_id.isnot(None))
+        .distinct()
+    )
+    changes.record(changes.TEST_RUN, changes.UPDATED, [run_id for (run_id,) in runs])
+
+BULK_ACTIONS = ('delete', 'update_status', 'update_priority')
+
+def apply_bulk_action(data, progress=None):
     action = data.get('action')
     test_case_ids = data.get('test_case_ids', [])
+    batch_size = current_app.config['JOB_BATCH_SIZE'] if progress else max(len(test_case_ids), 1)
     
-    if action == 'delete':
-        TestCase.query.filter(TestCase.id.in_(test_case_ids)).delete(synchronize_session=False)
-        db.session.commit()
-        return jsonify({"message": f"{len(test_case_ids)} test cases deleted"}), 200
+    done = 0
+    for batch in chunks(test_case_ids, batch_size):
+        query = TestCase.query.filter(TestCase.id.in_(batch))
+        if action == 'delete':
+            paths = attachment_paths(batch)
+            record_case_deletes(batch)
+            query.delete(synchronize_session=False)
+            # submit_job commits, so the batch and its file cleanup land
+            # together even if a later batch fails or the job is cancelled
+            remove_files_later(paths)
+            relations.invalidate()
+            duplicates.invalidate()
+        elif action == 'update_status':
+            query.update({'status': data.get('status')}, synchronize_session=False)
+            changes.record(changes.TEST_CASE, changes.UPDATED, batch)
+        elif action == 'update_priority':
+            query.update({'priority': data.get('priority')}, synchronize_session=False)
+            changes.record(changes.TEST_CASE, changes.UPDATED, batch)
+        done += len(batch)
+        if progress:
+            progress(done, len(test_case_ids))
+    db.session.commit()
     
+    if action == 'delete':
+        return f"{len(test_case_ids)} test cases deleted"
     elif action == 'update_status':
-        status = data.get('status')
-        TestCase.query.filter(TestCase.id.in_(test_case_ids)).update({'status': status}, synchronize_session=False)
-        db.session.commit()
-        return jsonify({"message": f"Status updated for {len(test_case_ids)} test cases"}), 200
+        return f"Status updated for {len(test_case_ids)} test cases"
+    return f"Priority updated for {len(test_case_ids)} test cases"
+
+@job_handler('bulk_operation')
+def bulk_operation_job(ctx):
+    return {"message": apply_bulk_action(ctx.payload, ctx.progress)}
+
+@bp.route('/api/testcases/bulk', methods=['POST'])
+def bulk_operations():
+    data = request.json
+    if data.get('action') not in BULK_ACTIONS:
+        return jsonify({"error": "Invalid action"}), 400
     
-    elif action == 'update_priority':
-        priority = data.get('priority')
-        TestCase.query.filter(TestCase.id.in_(test_case_ids)).update({'priority': priority}, synchronize_session=False)
-        db.session.commit()
-        return jsonify({"message": f"Priority updated for {len(test_case_ids)} test cases"}), 200
+    if wants_job():
+        job = submit_job('bulk_operation', data)
+        return jsonify({"message": "Bulk operation queued", "job_id": job.id}), 202
     
-    return jsonify({"error": "Invalid action"}), 400
+    return jsonify({"message": apply_bulk_action(data)}), 200
 
 # --- API: COMMENTS ---
-@app.route('/api/testcases/<int:test_case_id>/comments', methods=['POST'])
+@bp.route('/api/testcases/<int:test_case_id>/comments', methods=['POST'])
 def add_comment(test_case_id):
     test_case = TestCase.query.get_or_404(test_case_id)
     data = request.json
@@ -357,18 +486,20 @@ def add_comment(test_case_id):
         comment=data.get('comment', '')
     )
     db.session.add(comment)
+    changes.record(changes.TEST_CASE, changes.UPDATED, [test_case_id])
     db.session.commit()
     return jsonify({"message": "Comment added", "id": comment.id}), 201
 
-@app.route('/api/comments/<int:comment_id>', methods=['DELETE'])
+@bp.route('/api/comments/<int:comment_id>', methods=['DELETE'])
 def delete_comment(comment_id):
     comment = TestCaseComment.query.get_or_404(comment_id)
     db.session.delete(comment)
+    changes.record(changes.TEST_CASE, changes.UPDATED, [comment.test_case_id])
     db.session.commit()
     return jsonify({"message": "Comment deleted"}), 200
 
 # --- API: ATTACHMENTS ---
-@app.route('/api/testcases/<int:test_case_id>/attachments', methods=['POST'])
+@bp.route('/api/testcases/<int:test_case_id>/attachments', methods=['POST'])
 def upload_attachment(test_case_id):
     test_case = TestCase.query.get_or_404(test_case_id)
     
@@ -392,51 +523,54 @@ def upload_attachment(test_case_id):
             file_type=filename.rsplit('.', 1)[1].lower()
         )
         db.session.add(attachment)
+        changes.record(changes.TEST_CASE, changes.UPDATED, [test_case_id])
         db.session.commit()
         return jsonify({"message": "File uploaded", "id": attachment.id}), 201
     
     return jsonify({"error": "Invalid file type"}), 400
 
-@app.route('/api/attachments/<int:attachment_id>', methods=['GET'])
+def attachment_paths(test_case_ids):
+    return [
+        path for (path,) in
+        db.session.query(Attachment.file_path).filter(Attachment.test_case_id.in_(test_case_ids))
+    ]
+
+@job_handler('remove_files')
+def remove_files_job(ctx):
+    removed = 0
+    for path in ctx.payload.get('paths', []):
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return {"message": f"{removed} files removed"}
+
+def remove_files_later(paths):
+    """Delete attachment files in a background job once their rows are gone."""
+    if paths:
+        submit_job('remove_files', {"paths": paths})
+
+@bp.route('/api/attachments/<int:attachment_id>', methods=['GET'])
 def download_attachment(attachment_id):
     attachment = Attachment.query.get_or_404(attachment_id)
     return send_file(attachment.file_path, as_attachment=True, download_name=attachment.filename)
 
-@app.route('/api/attachments/<int:attachment_id>', methods=['DELETE'])
+@bp.route('/api/attachments/<int:attachment_id>', methods=['DELETE'])
 def delete_attachment(attachment_id):
     attachment = Attachment.query.get_or_404(attachment_id)
     if os.path.exists(attachment.file_path):
         os.remove(attachment.file_path)
     db.session.delete(attachment)
+    if attachment.test_case_id:
+        changes.record(changes.TEST_CASE, changes.UPDATED, [attachment.test_case_id])
     db.session.commit()
     return jsonify({"message": "Attachment deleted"}), 200
 
 # --- API: TEMPLATES ---
-@app.route('/api/templates', methods=['GET'])
+@bp.route('/api/templates', methods=['GET'])
 def get_templates():
-    templates = TestCaseTemplate.query.all()
-    return jsonify([
-        {
-            "id": t.id,
-            "name": t.name,
-            "description": t.description or "",
-            "precondition": t.precondition or "",
-            "postcondition": t.postcondition or "",
-            "category": t.category or "",
-            "steps": [
-                {
-                    "id": step.id,
-                    "description": step.description,
-                    "expected_result": step.expected_result,
-                    "order": step.order
-                }
-                for step in sorted(t.template_steps, key=lambda s: s.order)
-            ]
-        }
-        for t in templates
-    ])
+    return serialize(serializers.template_list(TestCaseTemplate.query.order_by(TestCaseTemplate.id)))
 
-@app.route('/api/templates', methods=['POST'])
+@bp.route('/api/templates', methods=['POST'])
 def create_template():
     data = request.json
     
@@ -459,32 +593,164 @@ def create_template():
         )
         db.session.add(template_step)
     
+    changes.record(changes.TEMPLATE, changes.CREATED, [template.id])
     db.session.commit()
     return jsonify({"message": "Template created", "id": template.id}), 201
 
-@app.route('/api/templates/<int:template_id>', methods=['DELETE'])
+PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}')
+
+def fill_placeholders(text, params):
+    """Replace ``{{key}}`` with ``params[key]``; unknown placeholders are left as-is."""
+    if not text:
+        return text or ''
+    return PLACEHOLDER.sub(
+        lambda m: str(params[m.group(1)]) if m.group(1) in params else m.group(0),
+        text
+    )
+
+def read_parameter_rows():
+    """Parameter rows and options from a CSV/JSON upload or a JSON body."""
+    if 'file' in request.files:
+        file = request.files['file']
+        content = file.read().decode('utf-8-sig')
+        if file.filename.endswith('.json'):
+            rows = json.loads(content)
+        elif file.filename.endswith('.csv'):
+            rows = list(csv.DictReader(io.StringIO(content)))
+        else:
+            raise ValueError("Unsupported file format")
+        options = request.form
+    else:
+        options = request.json or {}
+        rows = options.get('rows', [])
+    
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError("Parameters must be a list of objects")
+    return rows, {
+        "name": options.get('name'),
+        "status": options.get('status') or TestStatus.NOT_RUN.value,
+        "priority": options.get('priority') or Priority.MEDIUM.value,
+        "tags": options.get('tags', '')
+    }
+
+def instantiate_template(template, rows, options, progress=None):
+    """Create one test case per parameter row, with steps and a version-1 snapshot.
+    
+    Rows are inserted in batches of JOB_BATCH_SIZE using one multi-row
+    INSERT per table instead of flushing every object.
+    """
+    steps = sorted(template.template_steps, key=lambda s: s.order)
+    name_pattern = options.get('name') or template.name
+    batch_size = current_app.config['JOB_BATCH_SIZE']
+    created_ids = []
+    
+    for batch in chunks(rows, batch_size):
+        cases = [
+            {
+                "name": fill_placeholders(name_pattern, params),
+                "description": fill_placeholders(template.description, params),
+                "precondition": fill_placeholders(template.precondition, params),
+                "postcondition": fill_placeholders(template.postcondition, params),
+                "comment": '',
+                "status": options['status'],
+                "priority": options['priority'],
+                "category": template.category or '',
+                "tags": options['tags'],
+                "template_id": template.id
+            }
+            for params in batch
+        ]
+        case_ids = db.session.scalars(
+            insert(TestCase).returning(TestCase.id, sort_by_parameter_order=True), cases
+        ).all()
+        version_ids = db.session.scalars(
+            insert(TestCaseVersion).returning(TestCaseVersion.id, sort_by_parameter_order=True),
+            [
+                {
+                    "test_case_id": case_id,
+                    "version_number": 1,
+                    "name": case["name"],
+                    "description": case["description"],
+                    "precondition": case["precondition"],
+                    "postcondition": case["postcondition"],
+                    "comment": case["comment"]
+                }
+                for case_id, case in zip(case_ids, cases)
+            ]
+        ).all()
+        
+        step_rows = []
+        version_step_rows = []
+        for case_id, version_id, params in zip(case_ids, version_ids, batch):
+            for idx, template_step in enumerate(steps):
+                description = fill_placeholders(template_step.description, params)
+                expected_result = fill_placeholders(template_step.expected_result, params)
+                step_rows.append({
+                    "test_case_id": case_id,
+                    "description": description,
+                    "expected_result": expected_result,
+                    "order": idx
+                })
+                version_step_rows.append({
+                    "version_id": version_id,
+                    "description": description,
+                    "expected_result": expected_result,
+                    "order": idx
+                })
+        if step_rows:
+            db.session.execute(insert(Step), step_rows)
+            db.session.execute(insert(VersionStep), version_step_rows)
+        duplicates.update_signatures(case_ids)
+        changes.record(changes.TEST_CASE, changes.CREATED, case_ids)
+        
+        created_ids.extend(case_ids)
+        if progress:
+            progress(len(created_ids), len(rows))
+    
+    db.session.commit()
+    return created_ids
+
+@job_handler('template_instantiate')
+def template_instantiate_job(ctx):
+    template = TestCaseTemplate.query.get(ctx.payload['template_id'])
+    if template is None:
+        raise ValueError("Template not found")
+    rows = ctx.payload['rows']
+    ctx.progress(0, len(rows))
+    created_ids = instantiate_template(template, rows, ctx.payload['options'], ctx.progress)
+    return {"message": f"{len(created_ids)} test cases created", "ids": created_ids}
+
+@bp.route('/api/templates/<int:template_id>/instantiate', methods=['POST'])
+def instantiate_template_route(template_id):
+    template = TestCaseTemplate.query.get_or_404(template_id)
+    try:
+        rows, options = read_parameter_rows()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not rows:
+        return jsonify({"error": "No parameter rows provided"}), 400
+    
+    if wants_job():
+        job = submit_job('template_instantiate', {"template_id": template.id, "rows": rows, "options": options})
+        return jsonify({"message": "Instantiation queued", "job_id": job.id}), 202
+    
+    created_ids = instantiate_template(template, rows, options)
+    return jsonify({"message": f"{len(created_ids)} test cases created", "ids": created_ids}), 201
+
+@bp.route('/api/templates/<int:template_id>', methods=['DELETE'])
 def delete_template(template_id):
     template = TestCaseTemplate.query.get_or_404(template_id)
     db.session.delete(template)
+    changes.record(changes.TEMPLATE, changes.DELETED, [template_id])
     db.session.commit()
     return jsonify({"message": "Template deleted"}), 200
 
 # --- API: TEST RUNS ---
-@app.route('/api/testruns', methods=['GET'])
+@bp.route('/api/testruns', methods=['GET'])
 def get_test_runs():
-    test_runs = TestRun.query.order_by(TestRun.created_at.desc()).all()
-    return jsonify([
-        {
-            "id": tr.id,
-            "name": tr.name,
-            "description": tr.description or "",
-            "created_at": tr.created_at.isoformat() if tr.created_at else "",
-            "executions_count": len(tr.executions)
-        }
-        for tr in test_runs
-    ])
-
-@app.route('/api/testruns', methods=['POST'])
+    return serialize(serializers.test_run_list(TestRun.query.order_by(TestRun.created_at.desc())))
+
+@bp.route('/api/testruns', methods=['POST'])
 def create_test_run():
     data = request.json
     
@@ -495,66 +761,35 @@ def create_test_run():
     db.session.add(test_run)
     db.session.flush()
     
-    # Add test cases to run
-    for test_case_id in data.get('test_case_ids', []):
-        execution = TestCaseExecution(
-            test_case_id=test_case_id,
-            test_run_id=test_run.id,
-            status=TestStatus.NOT_RUN.value
+    # Add test cases to run with INSERT ... SELECT; unknown ids are skipped
+    for batch in chunks(data.get('test_case_ids', []), 1000):
+        insert_from_select(
+            TestCaseExecution,
+            ['test_run_id', 'test_case_id', 'status'],
+            select(literal(test_run.id), TestCase.id, literal(TestStatus.NOT_RUN.value))
+            .where(TestCase.id.in_(batch))
+            .order_by(TestCase.id)
         )
-        db.session.add(execution)
     
+    changes.record(changes.TEST_RUN, changes.CREATED, [test_run.id])
     db.session.commit()
     return jsonify({"message": "Test run created", "id": test_run.id}), 201
 
-@app.route('/api/testruns/<int:test_run_id>', methods=['GET'])
+@bp.route('/api/testruns/<int:test_run_id>', methods=['GET'])
 def get_test_run(test_run_id):
     test_run = TestRun.query.get_or_404(test_run_id)
-    return jsonify({
-        "id": test_run.id,
-        "name": test_run.name,
-        "description": test_run.description or "",
-        "created_at": test_run.created_at.isoformat() if test_run.created_at else "",
-        "executions": [
-            {
-                "id": ex.id,
-                "test_case_id": ex.test_case_id,
-                "test_case_name": ex.test_case.name,
-                "test_case": {
-                    "id": ex.test_case.id,
-                    "name": ex.test_case.name,
-                    "description": ex.test_case.description,
-                    "precondition": ex.test_case.precondition or "",
-                    "postcondition": ex.test_case.postcondition or "",
-                    "category": ex.test_case.category or "",
-                    "priority": ex.test_case.priority,
-                    "steps": [
-                        {
-                            "id": step.id,
-                            "description": step.description,
-                            "expected_result": step.expected_result,
-                            "actual_result": step.actual_result or "",
-                            "order": step.order
-                        }
-                        for step in sorted(ex.test_case.steps, key=lambda s: s.order)
-                    ]
-                },
-                "status": ex.status,
-                "executed_at": ex.executed_at.isoformat() if ex.executed_at else "",
-                "notes": ex.notes or ""
-            }
-            for ex in test_run.executions
-        ]
-    })
+    return serialize(serializers.test_run_detail(test_run))
 
-@app.route('/api/testruns/<int:test_run_id>', methods=['DELETE'])
+@bp.route('/api/testruns/<int:test_run_id>', methods=['DELETE'])
 def delete_test_run(test_run_id):
     test_run = TestRun.query.get_or_404(test_run_id)
+    # Executions go with ON DELETE CASCADE
     db.session.delete(test_run)
+    changes.record(changes.TEST_RUN, changes.DELETED, [test_run_id])
     db.session.commit()
     return jsonify({"message": "Test run deleted"}), 200
 
-@app.route('/api/testruns/<int:test_run_id>/executions/<int:execution_id>', methods=['PUT'])
+@bp.route('/api/testruns/<int:test_run_id>/executions/<int:execution_id>', methods=['PUT'])
 def update_execution(test_run_id, execution_id):
     execution = TestCaseExecution.query.get_or_404(execution_id)
     data = request.json
@@ -568,6 +803,7 @@ def update_execution(test_run_id, execution_id):
         execution.executed_at = datetime.utcnow()
     
     # Update step actual results if provided
+    changed_cases = []
     if 'steps' in data:
         for step_data in data['steps']:
             step_id = step_data.get('id')
@@ -575,64 +811,147 @@ def update_execution(test_run_id, execution_id):
                 step = Step.query.get(step_id)
                 if step:
                     step.actual_result = step_data.get('actual_result', '')
+                    changed_cases.append(step.test_case_id)
     
     # Update test case status if it's the latest execution
     latest_execution = TestCaseExecution.query.filter_by(test_case_id=execution.test_case_id).order_by(TestCaseExecution.executed_at.desc()).first()
     if latest_execution and latest_execution.id == execution.id:
         execution.test_case.status = execution.status
         execution.test_case.updated_at = datetime.utcnow()
+        changed_cases.append(execution.test_case_id)
+    changes.record(changes.TEST_CASE, changes.UPDATED, changed_cases)
     
     db.session.commit()
     return jsonify({"message": "Execution updated"}), 200
 
-@app.route('/api/testruns/<int:test_run_id>/executions/<int:execution_id>', methods=['DELETE'])
+@bp.route('/api/testruns/<int:test_run_id>/executions/<int:execution_id>', methods=['DELETE'])
 def delete_execution(test_run_id, execution_id):
     execution = TestCaseExecution.query.get_or_404(execution_id)
     db.session.delete(execution)
+    if execution.test_run_id:
+        changes.record(changes.TEST_RUN, changes.UPDATED, [execution.test_run_id])
     db.session.commit()
     return jsonify({"message": "Execution deleted"}), 200
 
-@app.route('/api/steps/<int:step_id>', methods=['PUT'])
+@bp.route('/api/steps/<int:step_id>', methods=['PUT'])
 def update_step(step_id):
     step = Step.query.get_or_404(step_id)
     data = request.json
     
     step.actual_result = data.get('actual_result', step.actual_result)
+    changes.record(changes.TEST_CASE, changes.UPDATED, [step.test_case_id])
     
     db.session.commit()
     return jsonify({"message": "Step updated"}), 200
 
 # --- TEST RUN EXECUTION PAGE ---
-@app.route('/testrun/<int:test_run_id>')
+@bp.route('/testrun/<int:test_run_id>')
 def test_run_execution_page(test_run_id):
     return render_template('test_run_execution.html', test_run_id=test_run_id)
 
 # --- API: VERSIONS ---
-@app.route('/api/testcases/<int:test_case_id>/versions', methods=['GET'])
+@bp.route('/api/testcases/<int:test_case_id>/versions', methods=['GET'])
 def get_versions(test_case_id):
-    versions = TestCaseVersion.query.filter_by(test_case_id=test_case_id).order_by(TestCaseVersion.version_number.desc()).all()
-    return jsonify([
-        {
-            "id": v.id,
-            "version_number": v.version_number,
-            "name": v.name,
-            "created_at": v.created_at.isoformat() if v.created_at else "",
-            "steps": [
-                {
-                    "id": step.id,
-                    "description": step.description,
-                    "expected_result": step.expected_result,
-                    "order": step.order
-                }
-                for step in sorted(v.version_steps, key=lambda s: s.order)
-            ]
-        }
-        for v in versions
-    ])
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = request.args.get('per_page', current_app.config['VERSIONS_PER_PAGE'], type=int)
+    per_page = max(1, min(per_page, current_app.config['VERSIONS_MAX_PER_PAGE']))
+    include_steps = request.args.get('include_steps', '').lower() in ('1', 'true', 'yes')
+    
+    query = TestCaseVersion.query.filter_by(test_case_id=test_case_id)
+    total = query.count()
+    page_query = query.order_by(TestCaseVersion.version_number.desc()).limit(per_page).offset((page - 1) * per_page)
+    return serialize({
+        "versions": serializers.version_list(page_query, include_steps),
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": (total + per_page - 1) // per_page
+    })
+
+@bp.route('/api/testcases/<int:test_case_id>/versions/diff', methods=['GET'])
+def get_version_diff(test_case_id):
+    from_number = request.args.get('from', type=int)
+    to_number = request.args.get('to', type=int)
+    if from_number is None or to_number is None:
+        return jsonify({"error": "Both 'from' and 'to' version numbers are required"}), 400
+    
+    found = {
+        v.version_number: v for v in TestCaseVersion.query.filter(
+            TestCaseVersion.test_case_id == test_case_id,
+            TestCaseVersion.version_number.in_([from_number, to_number])
+        )
+    }
+    missing = [n for n in (from_number, to_number) if n not in found]
+    if missing:
+        return jsonify({"error": f"Version {missing[0]} not found"}), 404
+    return serialize(versions.diff_versions(found[from_number], found[to_number]))
+
+# --- API: RELATED CASES ---
+def graph_args():
+    depth = request.args.get('depth', current_app.config['GRAPH_DEFAULT_DEPTH'], type=int)
+    return max(0, min(depth, current_app.config['GRAPH_MAX_DEPTH']))
+
+@bp.route('/api/testcases/<int:test_case_id>/graph', methods=['GET'])
+def get_related_graph(test_case_id):
+    TestCase.query.get_or_404(test_case_id)
+    direction = request.args.get('direction', 'both')
+    if direction not in relations.DIRECTIONS:
+        return jsonify({"error": f"direction must be one of {', '.join(relations.DIRECTIONS)}"}), 400
+    return serialize(relations.related_graph(test_case_id, graph_args(), direction))
+
+@bp.route('/api/testcases/<int:test_case_id>/impact', methods=['GET'])
+def get_impact(test_case_id):
+    TestCase.query.get_or_404(test_case_id)
+    return serialize(relations.impact(test_case_id, graph_args()))
+
+# --- API: DUPLICATES ---
+def threshold_arg():
+    # LSH banding misses most pairs below MIN_THRESHOLD, so lower values are raised to it
+    threshold = request.args.get('threshold', current_app.config['DUPLICATE_THRESHOLD'], type=float)
+    return round(max(duplicates.MIN_THRESHOLD, min(threshold, 1.0)), duplicates.THRESHOLD_DIGITS)
+
+def threshold_info(threshold):
+    return {
+        "threshold": threshold,
+        "min_threshold": duplicates.MIN_THRESHOLD,
+        # Estimated share of pairs at exactly the threshold that are found
+        "recall": round(duplicates.candidate_probability(threshold), 3)
+    }
+
+@bp.route('/api/duplicates', methods=['GET'])
+def get_duplicate_clusters():
+    threshold = threshold_arg()
+    limit = request.args.get('limit', current_app.config['DUPLICATE_MAX_CLUSTERS'], type=int)
+    return serialize({
+        **threshold_info(threshold),
+        "clusters": duplicates.clusters(threshold, current_app.config['DUPLICATE_MAX_BUCKET_SIZE'], max(limit, 1))
+    })
+
+@bp.route('/api/testcases/<int:test_case_id>/duplicates', methods=['GET'])
+def get_test_case_duplicates(test_case_id):
+    TestCase.query.get_or_404(test_case_id)
+    threshold = threshold_arg()
+    return serialize({
+        "id": test_case_id,
+        **threshold_info(threshold),
+        "duplicates": duplicates.similar_to(test_case_id, threshold)
+    })
+
+@job_handler('duplicate_index')
+def duplicate_index_job(ctx):
+    indexed = duplicates.reindex(current_app.config['JOB_BATCH_SIZE'], ctx.progress)
+    return {"message": f"{indexed} test cases indexed", "indexed": indexed}
+
+@bp.route('/api/duplicates/reindex', methods=['POST'])
+def reindex_duplicates():
+    job = submit_job('duplicate_index')
+    return jsonify({"message": "Reindex queued", "job_id": job.id}), 202
 
 # --- API: EXPORT ---
-@app.route('/api/export/<int:test_case_id>', methods=['GET'])
+@bp.route('/api/export/<int:test_case_id>', methods=['GET'])
 def export_to_word(test_case_id):
+    from docx import Document
+    
     test_case = TestCase.query.get_or_404(test_case_id)
     steps = sorted(test_case.steps, key=lambda s: s.order)
     
@@ -671,15 +990,13 @@ def export_to_word(test_case_id):
     doc.save(filename)
     return send_from_directory(UPLOAD_FOLDER, f"TestCase_{test_case_id}.docx", as_attachment=True)
 
-@app.route('/api/export/bulk', methods=['POST'])
-def bulk_export():
-    data = request.json
-    test_case_ids = data.get('test_case_ids', [])
+def build_bulk_export(test_case_ids, progress=None):
+    from docx import Document
     
     doc = Document()
     doc.add_heading("Bulk Test Cases Export", level=1)
     
-    for test_case_id in test_case_ids:
+    for idx, test_case_id in enumerate(test_case_ids, 1):
         test_case = TestCase.query.get(test_case_id)
         if test_case:
             doc.add_heading(test_case.name, level=2)
@@ -699,13 +1016,112 @@ def bulk_export():
                 row_cells[2].text = step.actual_result or ""
             
             doc.add_page_break()
+        
+        if progress and idx % current_app.config['JOB_BATCH_SIZE'] == 0:
+            progress(idx, len(test_case_ids))
     
-    filename = f"{UPLOAD_FOLDER}/Bulk_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.docx"
+    filename = f"{UPLOAD_FOLDER}/Bulk_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.docx"
     doc.save(filename)
-    return send_from_directory(UPLOAD_FOLDER, os.path.basename(filename), as_attachment=True)
+    return os.path.basename(filename)
+
+@job_handler('bulk_export')
+def bulk_export_job(ctx):
+    test_case_ids = ctx.payload.get('test_case_ids', [])
+    ctx.progress(0, len(test_case_ids))
+    filename = build_bulk_export(test_case_ids, ctx.progress)
+    ctx.progress(len(test_case_ids))
+    return {"message": "Export ready", "file": filename}
+
+@bp.route('/api/export/bulk', methods=['POST'])
+def bulk_export():
+    data = request.json
+    test_case_ids = data.get('test_case_ids', [])
+    
+    if wants_job():
+        job = submit_job('bulk_export', {"test_case_ids": test_case_ids})
+        return jsonify({"message": "Export queued", "job_id": job.id}), 202
+    
+    filename = build_bulk_export(test_case_ids)
+    return send_from_directory(UPLOAD_FOLDER, filename, as_attachment=True)
 
 # --- API: IMPORT ---
-@app.route('/api/import', methods=['POST'])
+IMPORT_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+def read_import_file(file, filename):
+    import pandas as pd
+    
+    if filename.endswith('.xlsx') or filename.endswith('.xls'):
+        return pd.read_excel(file)
+    return pd.read_csv(file)
+
+def import_steps(test_case_id, steps_data):
+    """Step rows for an imported case; malformed step data is ignored."""
+    if not steps_data:
+        return []
+    try:
+        steps_list = json.loads(steps_data) if isinstance(steps_data, str) else steps_data
+        return [
+            {
+                "test_case_id": test_case_id,
+                "description": str(step_data.get('description', '')),
+                "expected_result": str(step_data.get('expected_result', '')),
+                "order": idx
+            }
+            for idx, step_data in enumerate(steps_list)
+        ]
+    except (ValueError, TypeError, AttributeError):
+        return []
+
+def import_dataframe(df, progress=None):
+    records = df.to_dict('records')
+    imported_count = 0
+    
+    for batch in chunks(records, current_app.config['JOB_BATCH_SIZE']):
+        cases = [
+            {
+                "name": str(row.get('name', '')),
+                "description": str(row.get('description', '')),
+                "precondition": str(row.get('precondition', '')),
+                "postcondition": str(row.get('postcondition', '')),
+                "status": str(row.get('status', TestStatus.NOT_RUN.value)),
+                "priority": str(row.get('priority', Priority.MEDIUM.value)),
+                "category": str(row.get('category', '')),
+                "tags": str(row.get('tags', ''))
+            }
+            for row in batch
+        ]
+        case_ids = db.session.scalars(
+            insert(TestCase).returning(TestCase.id, sort_by_parameter_order=True), cases
+        ).all()
+        
+        step_rows = []
+        for case_id, row in zip(case_ids, batch):
+            step_rows.extend(import_steps(case_id, row.get('steps', '')))
+        if step_rows:
+            db.session.execute(insert(Step), step_rows)
+        duplicates.update_signatures(case_ids)
+        changes.record(changes.TEST_CASE, changes.CREATED, case_ids)
+        
+        imported_count += len(batch)
+        if progress:
+            progress(imported_count, len(records))
+    
+    return imported_count
+
+@job_handler('import')
+def import_job(ctx):
+    path = ctx.payload['path']
+    try:
+        df = read_import_file(path, ctx.payload['filename'])
+        ctx.progress(0, len(df))
+        imported_count = import_dataframe(df, ctx.progress)
+        ctx.progress(imported_count)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return {"message": f"{imported_count} test cases imported", "imported": imported_count}
+
+@bp.route('/api/import', methods=['POST'])
 def import_test_cases():
     if 'file' not in request.files:
         return jsonify({"error": "No file provided"}), 400
@@ -713,49 +1129,18 @@ def import_test_cases():
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No file selected"}), 400
+    if not file.filename.endswith(IMPORT_EXTENSIONS):
+        return jsonify({"error": "Unsupported file format"}), 400
+    
+    if wants_job():
+        path = os.path.join(current_app.config['JOB_FOLDER'], f"{uuid.uuid4()}_{secure_filename(file.filename)}")
+        file.save(path)
+        job = submit_job('import', {"path": path, "filename": file.filename})
+        return jsonify({"message": "Import queued", "job_id": job.id}), 202
     
     try:
-        if file.filename.endswith('.xlsx') or file.filename.endswith('.xls'):
-            df = pd.read_excel(file)
-        elif file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        else:
-            return jsonify({"error": "Unsupported file format"}), 400
-        
-        imported_count = 0
-        
-        for _, row in df.iterrows():
-            test_case = TestCase(
-                name=str(row.get('name', '')),
-                description=str(row.get('description', '')),
-                precondition=str(row.get('precondition', '')),
-                postcondition=str(row.get('postcondition', '')),
-                status=str(row.get('status', TestStatus.NOT_RUN.value)),
-                priority=str(row.get('priority', Priority.MEDIUM.value)),
-                category=str(row.get('category', '')),
-                tags=str(row.get('tags', ''))
-            )
-            db.session.add(test_case)
-            db.session.flush()
-            
-            # Import steps if available
-            steps_data = row.get('steps', '')
-            if steps_data:
-                try:
-                    steps_list = json.loads(steps_data) if isinstance(steps_data, str) else steps_data
-                    for idx, step_data in enumerate(steps_list):
-                        step = Step(
-                            test_case_id=test_case.id,
-                            description=str(step_data.get('description', '')),
-                            expected_result=str(step_data.get('expected_result', '')),
-                            order=idx
-                        )
-                        db.session.add(step)
-                except:
-                    pass
-            
-            imported_count += 1
-        
+        df = read_import_file(file, file.filename)
+        imported_count = import_dataframe(df)
         db.session.commit()
         return jsonify({"message": f"{imported_count} test cases imported"}), 201
     
@@ -763,14 +1148,114 @@ def import_test_cases():
         db.session.rollback()
         return jsonify({"error": str(e)}), 400
 
+# --- API: JOBS ---
+@bp.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    query = Job.query
+    status_filter = request.args.get('status', '')
+    if status_filter:
+        query = query.filter_by(status=status_filter)
+    jobs = query.order_by(Job.created_at.desc()).limit(100).all()
+    return jsonify([job_to_dict(job) for job in jobs])
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    job = Job.query.get_or_404(job_id)
+    return jsonify(job_to_dict(job))
+
+@bp.route('/api/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    job = Job.query.get_or_404(job_id)
+    cancel_job(job)
+    return jsonify(job_to_dict(job)), 200
+
+@bp.route('/api/jobs/<int:job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    job = Job.query.get_or_404(job_id)
+    result = json.loads(job.result) if job.result else {}
+    if not result.get('file'):
+        return jsonify({"error": "Job has no downloadable result"}), 404
+    return send_from_directory(current_app.config['EXPORT_FOLDER'], result['file'], as_attachment=True)
+
+# --- API: EXECUTION ARCHIVE ---
+@job_handler('archive_executions')
+def archive_executions_job(ctx):
+    result = archive.archive_executions(ctx.payload.get('days'), ctx.progress)
+    return {"message": f"{result['archived']} executions archived", **result}
+
+schedule_job('archive_executions', 'ARCHIVE_INTERVAL_HOURS')
+
+def parse_day(value):
+    return date.fromisoformat(value) if value else None
+
+@bp.route('/api/archive', methods=['POST'])
+def start_archive():
+    data = request.get_json(silent=True) or {}
+    days = data.get('days')
+    # bool is an int subclass; a zero or negative window would archive everything
+    if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 1):
+        return jsonify({"error": "days must be an integer of at least 1"}), 400
+    job = submit_job('archive_executions', {"days": days})
+    return jsonify({"message": "Archival queued", "job_id": job.id}), 202
+
+@bp.route('/api/archive/executions', methods=['GET'])
+def get_archived_executions():
+    try:
+        end = parse_day(request.args.get('to')) or datetime.utcnow().date()
+        start = parse_day(request.args.get('from')) or end
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    max_days = current_app.config['ARCHIVE_MAX_READ_DAYS']
+    if start > end or end - start > timedelta(days=max_days - 1):
+        return jsonify({"error": f"Date range must span 1 to {max_days} days"}), 400
+    
+    executions, missing_files = archive.archived_between(
+        start, end,
+        test_case_id=request.args.get('test_case_id', type=int),
+        test_run_id=request.args.get('test_run_id', type=int)
+    )
+    return serialize({"executions": executions, "missing_files": missing_files})
+
+@bp.route('/api/testruns/<int:test_run_id>/archive', methods=['GET'])
+def get_archived_test_run(test_run_id):
+    executions, missing_files = archive.archived_run(test_run_id)
+    if not executions and not missing_files and db.session.get(TestRun, test_run_id) is None:
+        return jsonify({"error": "Test run not found"}), 404
+    return serialize({"id": test_run_id, "executions": executions, "missing_files": missing_files})
+
+@bp.route('/api/testcases/<int:test_case_id>/execution-summary', methods=['GET'])
+def get_execution_summary(test_case_id):
+    TestCase.query.get_or_404(test_case_id)
+    try:
+        start = parse_day(request.args.get('from'))
+        end = parse_day(request.args.get('to'))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
+    return serialize(archive.daily_summary(test_case_id, start, end))
+
+# --- API: CHANGES ---
+@bp.route('/api/changes', methods=['GET'])
+def get_changes():
+    since = request.args.get('since', type=int)
+    limit = request.args.get('limit', current_app.config['CHANGE_FEED_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['CHANGE_FEED_PAGE_SIZE']))
+    return serialize(changes.changes_since(since, limit))
+
+@job_handler('prune_changes')
+def prune_changes_job(ctx):
+    pruned = changes.prune(current_app.config['CHANGE_LOG_RETENTION_HOURS'])
+    return {"message": f"{pruned} change log entries pruned"}
+
+schedule_job('prune_changes', 'CHANGE_LOG_PRUNE_INTERVAL_HOURS')
+
 # --- API: CATEGORIES ---
-@app.route('/api/categories', methods=['GET'])
+@bp.route('/api/categories', methods=['GET'])
 def get_categories():
     categories = db.session.query(TestCase.category).distinct().filter(TestCase.category.isnot(None)).all()
     return jsonify([cat[0] for cat in categories])
 
 # --- API: TAGS ---
-@app.route('/api/tags', methods=['GET'])
+@bp.route('/api/tags', methods=['GET'])
 def get_tags():
     tags_set = set()
     test_cases = TestCase.query.filter(TestCase.tags.isnot(None)).all()
@@ -780,21 +1265,24 @@ def get_tags():
     return jsonify(list(tags_set))
 
 # Legacy routes for backward compatibility
-@app.route('/testcases', methods=['GET'])
+@bp.route('/testcases', methods=['GET'])
 def legacy_get_test_cases():
     return get_test_cases()
 
-@app.route('/testcases', methods=['POST'])
+@bp.route('/testcases', methods=['POST'])
 def legacy_create_test_case():
     return create_test_case()
 
-@app.route('/testcases/<int:test_case_id>', methods=['POST'])
+@bp.route('/testcases/<int:test_case_id>', methods=['POST'])
 def legacy_delete_test_case(test_case_id):
     return delete_test_case(test_case_id)
 
-@app.route('/export/<int:test_case_id>', methods=['GET'])
+@bp.route('/export/<int:test_case_id>', methods=['GET'])
 def legacy_export_to_word(test_case_id):
     return export_to_word(test_case_id)
 
 if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_db()
     app.run(debug=True)
@@ -0,0 +1,230 @@
+"""Cold storage for old ``TestCaseExecution`` rows.
+
+Executions older than ``ARCHIVE_RETENTION_DAYS`` are moved out of the hot
+table into gzip-compressed JSON Lines files, one per execution day::
+
+    ARCHIVE_FOLDER/executions/2024/03/2024-03-18.jsonl.gz
+
+Each archival batch appends a new gzip member to the day file, so files
+never need rewriting. An ``ExecutionArchive`` row records which test runs
+each file holds, so a run can be read back without scanning every file, and
+``ExecutionDailySummary`` keeps per-case, per-day status counts for
+analytics.
+
+A batch is deleted from the hot table, summarised and written to disk in
+one transaction. If the commit fails after the files were written, the
+rows are archived again by the next pass; readers drop the duplicates by
+execution id.
+"""
+import gzip
+import json
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+import changes
+from database import upsert
+from models import db, TestCaseExecution, ExecutionDailySummary, ExecutionArchive, TestStatus
+from serializers import dumps, orjson
+
+SUMMARY_COLUMNS = {
+    TestStatus.PASSED.value: 'passed',
+    TestStatus.FAILED.value: 'failed',
+    TestStatus.BLOCKED.value: 'blocked',
+    TestStatus.SKIPPED.value: 'skipped',
+    TestStatus.NOT_RUN.value: 'not_run',
+}
+
+FIELDS = ('id', 'test_run_id', 'test_case_id', 'status', 'executed_at', 'notes')
+
+
+def _loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def day_path(day):
+    return os.path.join('executions', f"{day:%Y}", f"{day:%m}", f"{day:%Y-%m-%d}.jsonl.gz")
+
+
+def cutoff_for(retention_days):
+    return datetime.utcnow() - timedelta(days=retention_days)
+
+
+def _summary_rows(rows):
+    counts = defaultdict(Counter)
+    for row in rows:
+        key = (row.test_case_id, row.executed_at.date())
+        counts[key]['total'] += 1
+        column = SUMMARY_COLUMNS.get(row.status)
+        if column:
+            counts[key][column] += 1
+    return [
+        {
+            "test_case_id": test_case_id,
+            "day": day,
+            "total": counter['total'],
+            **{column: counter[column] for column in SUMMARY_COLUMNS.values()}
+        }
+        for (test_case_id, day), counter in counts.items()
+    ]
+
+
+def _write_day(folder, day, rows):
+    path = day_path(day)
+    full_path = os.path.join(folder, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    # 'ab' starts a new gzip member; gzip readers concatenate members
+    with gzip.open(full_path, 'ab', compresslevel=6) as f:
+        for row in rows:
+            f.write(dumps({
+                "id": row.id,
+                "test_run_id": row.test_run_id,
+                "test_case_id": row.test_case_id,
+                "status": row.status,
+                "executed_at": row.executed_at.isoformat(),
+                "notes": row.notes or ""
+            }))
+            f.write(b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+    return path
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive up to ``batch_size`` executions older than ``cutoff``; returns the count.
+
+    Commits on success. Returns 0 when nothing is left to archive.
+    """
+    rows = (
+        db.session.query(*(getattr(TestCaseExecution, field) for field in FIELDS))
+        .filter(TestCaseExecution.executed_at < cutoff)
+        .order_by(TestCaseExecution.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    deleted = (
+        TestCaseExecution.query
+        .filter(TestCaseExecution.id.in_([row.id for row in rows]))
+        .delete(synchronize_session=False)
+    )
+    if deleted != len(rows):
+        # Another archiver (or a user delete) got to some of these rows
+        # first; start over from a fresh selection.
+        db.session.rollback()
+        return archive_batch(cutoff, batch_size)
+
+    upsert(
+        ExecutionDailySummary, _summary_rows(rows), ['test_case_id', 'day'],
+        increment_columns=['total', *SUMMARY_COLUMNS.values()]
+    )
+
+    by_day = defaultdict(list)
+    for row in rows:
+        by_day[row.executed_at.date()].append(row)
+    folder = current_app.config['ARCHIVE_FOLDER']
+    for day, day_rows in sorted(by_day.items()):
+        path = _write_day(folder, day, day_rows)
+        for test_run_id, count in Counter(row.test_run_id for row in day_rows).items():
+            db.session.add(ExecutionArchive(day=day, test_run_id=test_run_id, path=path, row_count=count))
+    # Execution counts shown in the run list changed
+    changes.record(changes.TEST_RUN, changes.UPDATED, [row.test_run_id for row in rows if row.test_run_id])
+
+    db.session.commit()
+    return len(rows)
+
+
+def archive_executions(retention_days=None, progress=None):
+    """Move every execution older than the retention window to the archive."""
+    if retention_days is None:
+        retention_days = current_app.config['ARCHIVE_RETENTION_DAYS']
+    if retention_days < 1:
+        raise ValueError("Retention must be at least 1 day")
+    cutoff = cutoff_for(retention_days)
+    batch_size = current_app.config['ARCHIVE_BATCH_SIZE']
+    total = TestCaseExecution.query.filter(TestCaseExecution.executed_at < cutoff).count()
+
+    archived = 0
+    if progress:
+        progress(0, total)
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        archived += count
+        if progress:
+            progress(archived, max(total, archived))
+    return {"archived": archived, "cutoff": cutoff.isoformat()}
+
+
+def read_archived(paths, test_run_id=None, test_case_id=None, start=None, end=None):
+    """``(rows, missing_files)`` for archived executions in ``paths`` matching the filters.
+
+    Rows are oldest first; ``start`` and ``end`` are inclusive ``date``
+    bounds on the execution day. ``missing_files`` lists recorded archive
+    files that are gone from disk: their rows no longer exist anywhere, so
+    callers must report them rather than return a silently partial result.
+    """
+    folder = current_app.config['ARCHIVE_FOLDER']
+    found = {}
+    missing = []
+    for path in sorted(set(paths)):
+        full_path = os.path.join(folder, path)
+        if not os.path.exists(full_path):
+            current_app.logger.error("Archive file %s is recorded but missing", full_path)
+            missing.append(path)
+            continue
+        with gzip.open(full_path, 'rb') as f:
+            for line in f:
+                row = _loads(line)
+                if test_run_id is not None and row['test_run_id'] != test_run_id:
+                    continue
+                if test_case_id is not None and row['test_case_id'] != test_case_id:
+                    continue
+                found[row['id']] = row
+    rows = sorted(found.values(), key=lambda row: (row['executed_at'], row['id']))
+    if start or end:
+        rows = [
+            row for row in rows
+            if (not start or row['executed_at'][:10] >= start.isoformat())
+            and (not end or row['executed_at'][:10] <= end.isoformat())
+        ]
+    return rows, missing
+
+
+def archived_run(test_run_id):
+    paths = [
+        path for (path,) in
+        db.session.query(ExecutionArchive.path).filter_by(test_run_id=test_run_id).distinct()
+    ]
+    return read_archived(paths, test_run_id=test_run_id)
+
+
+def archived_between(start, end, test_case_id=None, test_run_id=None):
+    paths = [
+        path for (path,) in
+        db.session.query(ExecutionArchive.path)
+        .filter(ExecutionArchive.day >= start, ExecutionArchive.day <= end)
+        .distinct()
+    ]
+    return read_archived(paths, test_run_id=test_run_id, test_case_id=test_case_id, start=start, end=end)
+
+
+def daily_summary(test_case_id, start=None, end=None):
+    query = ExecutionDailySummary.query.filter_by(test_case_id=test_case_id)
+    if start:
+        query = query.filter(ExecutionDailySummary.day >= start)
+    if end:
+        query = query.filter(ExecutionDailySummary.day <= end)
+    return [
+        {
+            "day": summary.day.isoformat(),
+            "total": summary.total,
+            **{column: getattr(summary, column) for column in SUMMARY_COLUMNS.values()}
+        }
+        for summary in query.order_by(ExecutionDailySummary.day)
+    ]
@@ -0,0 +1,61 @@
+"""Measure per-process startup cost of the app.
+
+Each variant runs in a fresh interpreter and reports wall time for its
+statement plus the process's peak RSS. "eager heavy imports" reproduces the
+old module-level ``import pandas`` / ``from docx import Document``.
+
+    python benchmarks/bench_startup.py [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import resource, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+VARIANTS = [
+    ("flask only", "import flask, flask_sqlalchemy"),
+    ("create_app (lazy imports)", "import app; app.create_app()"),
+    ("create_app + eager heavy imports",
+     "import pandas, docx, openpyxl; import app; app.create_app()"),
+]
+
+
+def run(statement, repeat):
+    times, rss = [], []
+    env = dict(os.environ, JOB_WORKER_ENABLED='0')
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(statement=statement)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        ).stdout.split()
+        times.append(float(out[0]))
+        rss.append(int(out[1]))
+    return statistics.median(times), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"median of {args.repeat} fresh interpreters")
+    print(f"{'variant':<36}{'import (ms)':>12}{'peak RSS (MiB)':>16}")
+    for label, statement in VARIANTS:
+        elapsed, rss = run(statement, args.repeat)
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        rss_mib = rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+        print(f"{label:<36}{elapsed * 1000:>12.0f}{rss_mib:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
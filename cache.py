@@ -0,0 +1,48 @@
+"""Per-process caches for derived query results.
+
+``TTLCache`` bounds staleness with a TTL and memory with a maximum entry
+count, evicting the least recently used entry first. Both limits are read
+from the app config on every call, so tests and deployments can tune them
+without touching module state. Each gunicorn worker has its own copy; the
+TTL bounds how long another worker's writes stay invisible.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+
+class TTLCache:
+    def __init__(self, ttl_setting, size_setting):
+        self.ttl_setting = ttl_setting
+        self.size_setting = size_setting
+        self._entries = OrderedDict()  # key -> (stored_at, value), least recently used first
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compute):
+        """Return the cached value for ``key``, calling ``compute()`` on a miss."""
+        ttl = current_app.config[self.ttl_setting]
+        now = time.monotonic()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and now - hit[0] < ttl:
+                self._entries.move_to_end(key)
+                return hit[1]
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            expired = [k for k, (stored_at, _) in self._entries.items() if now - stored_at >= ttl]
+            for k in expired:
+                del self._entries[k]
+            while len(self._entries) > current_app.config[self.size_setting]:
+                self._entries.popitem(last=False)
+        return value
@@ -0,0 +1,148 @@
+"""Change feed behind ``/api/changes``.
+
+Mutation routes call ``record`` inside their transaction, appending one
+``ChangeLog`` row per changed test case, test run or template. Clients
+keep the id of the last row they saw as a cursor and ask for everything
+after it; ``changes_since`` collapses repeated changes to the same entity
+into one created, updated or deleted entry and attaches the entity's
+list-view payload, so the UI can patch its local lists instead of
+reloading them.
+
+On PostgreSQL ids are handed out at insert time, so a row can become
+visible after a higher id already has. A gap in the ids is therefore only
+skipped once the row after it is ``CHANGE_FEED_GAP_TIMEOUT`` seconds old;
+until then the feed stops just before the gap. The cursor handed out with
+a reset follows the same rule. SQLite serialises writers, so its ids never
+become visible out of order.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+import serializers
+from models import db, ChangeLog, TestCase, TestRun, TestCaseTemplate
+
+TEST_CASE = 'testcase'
+TEST_RUN = 'testrun'
+TEMPLATE = 'template'
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+# entity -> (model, list-view builder); feed keys are the plural names
+ENTITIES = {
+    TEST_CASE: (TestCase, serializers.test_case_list),
+    TEST_RUN: (TestRun, serializers.test_run_list),
+    TEMPLATE: (TestCaseTemplate, serializers.template_list),
+}
+
+
+def record(entity, action, ids):
+    """Append a change for each id in ``ids`` to the current transaction."""
+    rows = [
+        {"entity": entity, "entity_id": entity_id, "action": action, "created_at": datetime.utcnow()}
+        for entity_id in dict.fromkeys(ids)
+    ]
+    if rows:
+        db.session.execute(ChangeLog.__table__.insert(), rows)
+
+
+def latest_cursor():
+    return db.session.query(func.max(ChangeLog.id)).scalar() or 0
+
+
+def _feed(cursor, changes, has_more=False, reset=False):
+    feed = {"cursor": cursor, "has_more": has_more, "reset": reset}
+    for entity in ENTITIES:
+        feed[entity + 's'] = changes.get(entity, {CREATED: [], UPDATED: [], DELETED: []})
+    return feed
+
+
+def _settled():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['CHANGE_FEED_GAP_TIMEOUT'])
+
+
+def _contiguous(cursor, rows, settled):
+    """Rows after ``cursor`` up to the first gap that may still be filled."""
+    for row in rows:
+        if row.id != cursor + 1 and row.created_at > settled:
+            return  # An earlier id may still be committing; retry later
+        yield row
+        cursor = row.id
+
+
+def _log_rows(after, limit=None):
+    query = (
+        db.session.query(ChangeLog.id, ChangeLog.entity, ChangeLog.entity_id, ChangeLog.action, ChangeLog.created_at)
+        .filter(ChangeLog.id > after)
+        .order_by(ChangeLog.id)
+    )
+    return query.limit(limit).all() if limit is not None else query.all()
+
+
+def _reset_cursor(first, settled):
+    """Highest cursor below which no change can still appear.
+
+    Rows older than the gap timeout count as settled, so only the recent
+    tail of the log is walked.
+    """
+    base = db.session.query(func.max(ChangeLog.id)).filter(ChangeLog.created_at <= settled).scalar()
+    if base is None:
+        base = (first or 1) - 1
+    cursor = base
+    for row in _contiguous(base, _log_rows(base), settled):
+        cursor = row.id
+    return cursor
+
+
+def changes_since(since, limit):
+    """Changes after cursor ``since``, at most ``limit`` log rows per call.
+
+    Each entity kind lists ``created`` and ``updated`` payloads and
+    ``deleted`` ids. ``reset`` is set when ``since`` is missing or older
+    than the retained log; the client must then reload its lists and
+    continue from ``cursor``, which obeys the same gap rule.
+    """
+    settled = _settled()
+    first, last = db.session.query(func.min(ChangeLog.id), func.max(ChangeLog.id)).one()
+    if since is None or (first is not None and since < first - 1) or since > (last or 0):
+        return _feed(_reset_cursor(first, settled), {}, reset=True)
+
+    rows = _log_rows(since, limit + 1)
+    cursor = since
+    latest = {}  # (entity, id) -> action the client needs to apply
+    for row in _contiguous(since, rows[:limit], settled):
+        key = (row.entity, row.entity_id)
+        # An update to a row created in the same window is still news of its creation
+        if not (row.action == UPDATED and latest.get(key) == CREATED):
+            latest[key] = row.action
+        cursor = row.id
+    has_more = len(rows) > limit and cursor == rows[limit - 1].id
+
+    changes = {}
+    for entity, (model, build) in ENTITIES.items():
+        actions = {entity_id: action for (kind, entity_id), action in latest.items() if kind == entity}
+        live = [entity_id for entity_id, action in actions.items() if action != DELETED]
+        payloads = build(model.query.filter(model.id.in_(live))) if live else []
+        found = {payload["id"] for payload in payloads}
+        changes[entity] = {
+            CREATED: [payload for payload in payloads if actions[payload["id"]] == CREATED],
+            UPDATED: [payload for payload in payloads if actions[payload["id"]] == UPDATED],
+            # Rows deleted after the change was logged are reported as deletions
+            DELETED: [entity_id for entity_id, action in actions.items() if action == DELETED or entity_id not in found]
+        }
+    return _feed(cursor, changes, has_more=has_more)
+
+
+def prune(retention_hours):
+    """Drop log rows older than the retention window, always keeping the newest."""
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    pruned = (
+        ChangeLog.query
+        .filter(ChangeLog.created_at < cutoff, ChangeLog.id < latest_cursor())
+        .delete(synchronize_session=False)
+    )
+    db.session.commit()
+    return pruned
@@ -0,0 +1,221 @@
+"""Database backend configuration and dialect-aware bulk helpers.
+
+The engine URL comes from ``DATABASE_URL`` (default: the SQLite file in
+``instance/``). PostgreSQL gets a sized connection pool; SQLite gets a busy
+timeout and WAL journaling so the web workers and job processes can read
+while one of them writes, and foreign key enforcement so ON DELETE CASCADE
+works as it does on PostgreSQL.
+"""
+import os
+import sqlite3
+
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import AddConstraint, CreateIndex, CreateTable
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db
+
+
+def database_url(instance_path):
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        return f'sqlite:///{os.path.join(instance_path, "database.db").replace(os.sep, "/")}'
+    # Accept Heroku-style postgres:// and pin the driver from requirements.txt
+    for scheme in ('postgres://', 'postgresql://'):
+        if url.startswith(scheme):
+            return 'postgresql+psycopg://' + url[len(scheme):]
+    return url
+
+
+def engine_options(url):
+    options = {
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', 30))}
+    else:
+        options['pool_size'] = int(os.environ.get('DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    return options
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    if os.environ.get('SQLITE_WAL', '1') == '1':
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+
+def dialect_name():
+    return db.session.get_bind().dialect.name
+
+
+def upsert(model, rows, index_elements, update_columns=(), increment_columns=()):
+    """INSERT ``rows`` into ``model``, updating existing rows on conflict.
+
+    ``update_columns`` are overwritten with the new values and
+    ``increment_columns`` have the new values added to them. Uses ON
+    CONFLICT DO UPDATE, which both SQLite (3.24+) and PostgreSQL support,
+    through their SQLAlchemy dialect constructs.
+    """
+    if not rows:
+        return
+    dialect = dialect_name()
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(model)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(model)
+    else:
+        raise NotImplementedError(f"upsert is not supported on {dialect}")
+    table = model.__table__
+    set_ = {column: stmt.excluded[column] for column in update_columns}
+    set_.update({column: table.c[column] + stmt.excluded[column] for column in increment_columns})
+    stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    db.session.execute(stmt, rows)
+
+
+def insert_from_select(model, columns, select_stmt):
+    """INSERT INTO ``model`` (columns) SELECT ... in one statement; returns the row count."""
+    result = db.session.execute(insert(model).from_select(columns, select_stmt))
+    return result.rowcount
+
+
+def missing_columns(engine):
+    """``[(table, column), ...]`` for model columns absent from existing tables."""
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        missing += [(table, column) for column in table.columns if column.name not in present]
+    return missing
+
+
+def add_missing_columns(engine):
+    """ALTER TABLE ... ADD COLUMN for nullable columns added to the models.
+
+    ``create_all()`` only creates missing tables. Returns ``table.column``
+    names that were added.
+    """
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+    with engine.begin() as conn:
+        for table, column in missing_columns(engine):
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} to an existing table")
+            conn.exec_driver_sql(
+                f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} '
+                f'{column.type.compile(dialect=engine.dialect)}'
+            )
+            added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def _foreign_key_rules(table):
+    return {
+        (tuple(fk.parent.name for fk in constraint.elements), constraint.referred_table.name): (constraint.ondelete or '').upper()
+        for constraint in table.foreign_key_constraints
+    }
+
+
+def _reflected_rules(inspector, table_name):
+    return {
+        (tuple(fk['constrained_columns']), fk['referred_table']): (
+            (fk.get('options') or {}).get('ondelete') or '').upper()
+        for fk in inspector.get_foreign_keys(table_name)
+    }
+
+
+def _stale_tables(inspector):
+    existing = set(inspector.get_table_names())
+    return [
+        table for table in db.metadata.sorted_tables
+        if table.name in existing and _reflected_rules(inspector, table.name) != _foreign_key_rules(table)
+    ]
+
+
+def stale_foreign_keys(engine):
+    """Names of existing tables whose ON DELETE rules differ from the models."""
+    return [table.name for table in _stale_tables(inspect(engine))]
+
+
+def upgrade_foreign_keys(engine):
+    """Bring ON DELETE rules of existing tables in line with the models.
+
+    ``create_all()`` never alters existing tables. PostgreSQL constraints are
+    dropped and re-added; SQLite cannot alter constraints, so affected tables
+    are rebuilt (the documented rename/create/copy procedure), dropping
+    orphaned child rows that enforcement would now reject. Returns the
+    names of the tables that changed.
+    """
+    inspector = inspect(engine)
+    stale = _stale_tables(inspector)
+    if not stale:
+        return []
+    if engine.dialect.name == 'sqlite':
+        _rebuild_sqlite_tables(engine, inspector, stale)
+    else:
+        with engine.begin() as conn:
+            for table in stale:
+                for fk in inspector.get_foreign_keys(table.name):
+                    conn.exec_driver_sql(
+                        f'ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} '
+                        f'DROP CONSTRAINT {engine.dialect.identifier_preparer.quote(fk["name"])}'
+                    )
+                for constraint in table.foreign_key_constraints:
+                    conn.execute(AddConstraint(constraint))
+    return [table.name for table in stale]
+
+
+def _rebuild_sqlite_tables(engine, inspector, tables):
+    quote = engine.dialect.identifier_preparer.quote
+    script = ['PRAGMA foreign_keys=OFF', 'PRAGMA legacy_alter_table=ON', 'BEGIN']
+    for table in tables:
+        name, old = table.name, f'{table.name}__old'
+        existing_columns = {column['name'] for column in inspector.get_columns(name)}
+        columns = [column.name for column in table.columns if column.name in existing_columns]
+        selected = []
+        conditions = []
+        for column in columns:
+            expr = quote(column)
+            fk = next(iter(table.c[column].foreign_keys), None)
+            if fk is not None:
+                parent = old if fk.column.table is table else fk.column.table.name
+                exists = f'{quote(column)} IN (SELECT {quote(fk.column.name)} FROM {quote(parent)})'
+                if (fk.ondelete or '').upper() == 'SET NULL':
+                    expr = f'CASE WHEN {exists} THEN {quote(column)} END'
+                else:
+                    conditions.append(f'({quote(column)} IS NULL OR {exists})')
+            selected.append(expr)
+        script += [f'DROP INDEX {quote(index["name"])}' for index in inspector.get_indexes(name)]
+        script.append(f'ALTER TABLE {quote(name)} RENAME TO {quote(old)}')
+        script.append(str(CreateTable(table).compile(dialect=engine.dialect)).strip())
+        script += [str(CreateIndex(index).compile(dialect=engine.dialect)) for index in table.indexes]
+        script.append(
+            f'INSERT INTO {quote(name)} ({", ".join(quote(c) for c in columns)}) '
+            f'SELECT {", ".join(selected)} FROM {quote(old)}'
+            + (f' WHERE {" AND ".join(conditions)}' if conditions else '')
+        )
+        script.append(f'DROP TABLE {quote(old)}')
+    script += ['COMMIT', 'PRAGMA legacy_alter_table=OFF', 'PRAGMA foreign_keys=ON']
+
+    connection = engine.raw_connection()
+    try:
+        connection.driver_connection.executescript(';\n'.join(script) + ';')
+    except Exception:
+        # Closing the sqlite3 connection rolls back the open transaction and
+        # keeps a connection with foreign_keys=OFF out of the pool.
+        connection.invalidate()
+        raise
+    finally:
+        connection.close()
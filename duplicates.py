@@ -0,0 +1,304 @@
+"""Near-duplicate test case detection with MinHash and LSH.
+
+Each case's name, description and step text is split into word 3-gram
+shingles and summarised as a ``NUM_PERM``-value MinHash signature; the
+fraction of equal signature values estimates the Jaccard similarity of
+two cases' shingle sets. Signatures are cut into ``BANDS`` bands and each
+band is hashed into a bucket (``TestCaseLshBucket``), so cases sharing any
+bucket become candidate pairs without comparing every pair. With 16 bands
+of 8 rows, pairs at 0.8 similarity are found with ~95% probability, at
+0.75 with ~81%, but at 0.6 only ~24%; thresholds are therefore clamped to
+``MIN_THRESHOLD``, below which results would silently miss most pairs.
+
+Signatures are refreshed by the routes that change case text
+(``update_signatures``); ``reindex`` rebuilds them all. Changing
+``NUM_PERM``, ``BANDS`` or ``SEED`` requires a reindex. Cluster results
+are cached per process for ``DUPLICATE_CACHE_TTL`` seconds, at most
+``DUPLICATE_CACHE_SIZE`` of them, and dropped whenever this process
+updates a signature.
+
+numpy is imported inside the functions that need it, like pandas in the
+import routes, to keep it out of process startup.
+"""
+import hashlib
+import re
+import zlib
+from datetime import datetime
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from sqlalchemy import and_, func, select
+
+from cache import TTLCache
+from database import upsert
+from models import db, TestCase, Step, TestCaseSignature, TestCaseLshBucket
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SEED = 1
+SHINGLE_SIZE = 3
+# Signatures resolve similarity in steps of 1/NUM_PERM, so finer thresholds
+# only multiply cache entries
+THRESHOLD_DIGITS = 2
+# Lowest threshold the banding above finds reliably (see candidate_probability)
+MIN_THRESHOLD = 0.75
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD = re.compile(r'\w+')
+_permutations = None
+
+_cache = TTLCache('DUPLICATE_CACHE_TTL', 'DUPLICATE_CACHE_SIZE')
+
+
+def invalidate():
+    _cache.clear()
+
+
+def _get_permutations():
+    global _permutations
+    if _permutations is None:
+        import numpy as np
+        rng = np.random.default_rng(SEED)
+        _permutations = (
+            rng.integers(1, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64),
+            rng.integers(0, _MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64),
+        )
+    return _permutations
+
+
+def shingles(text):
+    """Set of 32-bit hashes of the word 3-grams in ``text`` (single words for short texts)."""
+    words = _WORD.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = words
+    else:
+        grams = (' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1))
+    return {zlib.crc32(gram.encode('utf-8')) for gram in grams}
+
+
+def signature(shingle_set):
+    """MinHash signature (uint32 array of NUM_PERM values) of a non-empty shingle set."""
+    import numpy as np
+    a, b = _get_permutations()
+    values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    # uint64 arithmetic wraps instead of reducing mod 2**64; the result is
+    # still a good hash family once reduced to 32 bits.
+    with np.errstate(over='ignore'):
+        hashed = (np.outer(values, a) + b) % _MERSENNE_PRIME
+    return (hashed & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+def band_buckets(sig):
+    """One signed 63-bit bucket id per band (fits a BIGINT on every backend)."""
+    data = sig.astype('<u4').tobytes()
+    width = ROWS * 4
+    return [
+        int.from_bytes(hashlib.blake2b(data[i * width:(i + 1) * width], digest_size=8).digest(), 'little') >> 1
+        for i in range(BANDS)
+    ]
+
+
+def candidate_probability(similarity):
+    """Chance that a pair at ``similarity`` shares at least one LSH bucket."""
+    return 1 - (1 - similarity ** ROWS) ** BANDS
+
+
+def similarity(sig, other):
+    return float((sig == other).mean())
+
+
+def _load(blob):
+    import numpy as np
+    return np.frombuffer(blob, dtype='<u4')
+
+
+def _case_texts(case_ids):
+    texts = {
+        case_id: [name or '', description or '']
+        for case_id, name, description in
+        db.session.query(TestCase.id, TestCase.name, TestCase.description).filter(TestCase.id.in_(case_ids))
+    }
+    steps = (
+        db.session.query(Step.test_case_id, Step.description, Step.expected_result)
+        .filter(Step.test_case_id.in_(case_ids))
+        .order_by(Step.test_case_id, Step.order)
+    )
+    for case_id, description, expected_result in steps:
+        texts[case_id].extend((description or '', expected_result or ''))
+    return {case_id: '\n'.join(parts) for case_id, parts in texts.items()}
+
+
+def update_signatures(case_ids):
+    """Recompute signatures and LSH buckets of ``case_ids`` in the current transaction."""
+    case_ids = list(case_ids)
+    if not case_ids:
+        return
+    signatures = []
+    buckets = []
+    for case_id, text in _case_texts(case_ids).items():
+        shingle_set = shingles(text)
+        if not shingle_set:
+            continue  # Empty cases would all look identical
+        sig = signature(shingle_set)
+        signatures.append({
+            "test_case_id": case_id,
+            "signature": sig.astype('<u4').tobytes(),
+            "updated_at": datetime.utcnow()
+        })
+        buckets.extend(
+            {"test_case_id": case_id, "band": band, "bucket": bucket}
+            for band, bucket in enumerate(band_buckets(sig))
+        )
+
+    TestCaseLshBucket.query.filter(TestCaseLshBucket.test_case_id.in_(case_ids)).delete(synchronize_session=False)
+    indexed = [row["test_case_id"] for row in signatures]
+    TestCaseSignature.query.filter(
+        TestCaseSignature.test_case_id.in_(case_ids), TestCaseSignature.test_case_id.notin_(indexed)
+    ).delete(synchronize_session=False)
+    upsert(TestCaseSignature, signatures, ['test_case_id'], update_columns=['signature', 'updated_at'])
+    if buckets:
+        # Core insert: BANDS rows per case, without ORM bulk bookkeeping
+        db.session.execute(TestCaseLshBucket.__table__.insert(), buckets)
+    invalidate()
+
+
+def reindex(batch_size, progress=None):
+    """Rebuild signatures for every test case; commits once per batch."""
+    case_ids = [case_id for (case_id,) in db.session.query(TestCase.id).order_by(TestCase.id)]
+    done = 0
+    for i in range(0, len(case_ids), batch_size):
+        batch = case_ids[i:i + batch_size]
+        update_signatures(batch)
+        db.session.commit()
+        done += len(batch)
+        if progress:
+            progress(done, len(case_ids))
+    return done
+
+
+def _signatures(case_ids):
+    """``{case_id: signature}``; ``case_ids`` may be a list or a select of ids."""
+    batches = [case_ids[i:i + 1000] for i in range(0, len(case_ids), 1000)] if isinstance(case_ids, list) else [case_ids]
+    return {
+        case_id: _load(blob)
+        for batch in batches
+        for case_id, blob in
+        db.session.query(TestCaseSignature.test_case_id, TestCaseSignature.signature)
+        .filter(TestCaseSignature.test_case_id.in_(batch))
+    }
+
+
+def _names(case_ids):
+    names = {}
+    for i in range(0, len(case_ids), 1000):
+        names.update(
+            db.session.query(TestCase.id, TestCase.name).filter(TestCase.id.in_(case_ids[i:i + 1000]))
+        )
+    return names
+
+
+def candidate_buckets():
+    """``[[case_id, ...], ...]`` for every LSH bucket holding more than one case."""
+    lsh = TestCaseLshBucket.__table__
+    shared = (
+        select(lsh.c.band, lsh.c.bucket)
+        .group_by(lsh.c.band, lsh.c.bucket)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(lsh.c.band, lsh.c.bucket, lsh.c.test_case_id)
+        .join(shared, and_(lsh.c.band == shared.c.band, lsh.c.bucket == shared.c.bucket))
+        .order_by(lsh.c.band, lsh.c.bucket, lsh.c.test_case_id)
+    )
+    return [[row[2] for row in group] for _, group in groupby(rows.tuples(), key=itemgetter(0, 1))]
+
+
+def clusters(threshold, max_bucket_size=50, limit=None):
+    """Group cases whose estimated similarity is at least ``threshold``.
+
+    Candidate pairs come from shared LSH buckets and are confirmed against
+    the stored signatures; confirmed pairs are merged with union-find.
+    Within a bucket larger than ``max_bucket_size`` each member is only
+    compared with the bucket's first case, which keeps a bucket of
+    thousands of template copies linear instead of quadratic.
+    """
+    threshold = round(threshold, THRESHOLD_DIGITS)
+    return _cache.get(('clusters', threshold, max_bucket_size, limit),
+                      lambda: _clusters(threshold, max_bucket_size, limit))
+
+
+def _clusters(threshold, max_bucket_size, limit):
+    buckets = candidate_buckets()
+    sigs = _signatures(sorted({case_id for bucket in buckets for case_id in bucket}))
+
+    parent = {}
+
+    def find(x):
+        root = parent.setdefault(x, x)
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(x, y):
+        rx, ry = find(x), find(y)
+        if rx != ry:
+            parent[max(rx, ry)] = min(rx, ry)
+
+    for bucket in buckets:
+        members = [case_id for case_id in bucket if case_id in sigs]
+        if len(members) > max_bucket_size:
+            pairs = ((members[0], other) for other in members[1:])
+        else:
+            pairs = combinations(members, 2)
+        for x, y in pairs:
+            if find(x) != find(y) and similarity(sigs[x], sigs[y]) >= threshold:
+                union(x, y)
+
+    groups = {}
+    for case_id in list(parent):
+        groups.setdefault(find(case_id), []).append(case_id)
+    grouped = sorted((ids for ids in groups.values() if len(ids) > 1), key=lambda ids: (-len(ids), min(ids)))
+    if limit is not None:
+        grouped = grouped[:limit]
+
+    names = _names([case_id for ids in grouped for case_id in ids])
+    result = []
+    for ids in grouped:
+        ids.sort()
+        representative = sigs[ids[0]]
+        result.append({
+            "size": len(ids),
+            "cases": [
+                {"id": case_id, "name": names.get(case_id, ""), "similarity": round(similarity(representative, sigs[case_id]), 3)}
+                for case_id in ids
+            ]
+        })
+    return result
+
+
+def similar_to(case_id, threshold, limit=50):
+    """Cases whose estimated similarity to ``case_id`` is at least ``threshold``, best first."""
+    own = TestCaseLshBucket.query.filter_by(test_case_id=case_id).subquery()
+    candidates = (
+        db.session.query(TestCaseLshBucket.test_case_id)
+        .join(own, and_(TestCaseLshBucket.band == own.c.band, TestCaseLshBucket.bucket == own.c.bucket))
+        .distinct()
+        .subquery()
+        .select()
+    )
+    sigs = _signatures(candidates)
+    own_sig = sigs.pop(case_id, None)
+    if own_sig is None:
+        return []
+    scored = sorted(
+        ((similarity(own_sig, sig), other) for other, sig in sigs.items()),
+        key=lambda item: (-item[0], item[1])
+    )
+    matches = [(score, other) for score, other in scored if score >= threshold][:limit]
+    names = _names([other for _, other in matches])
+    return [{"id": other, "name": names.get(other, ""), "similarity": round(score, 3)} for score, other in matches]
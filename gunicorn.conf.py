@@ -0,0 +1,20 @@
+# Gunicorn settings used by the Docker image.
+#
+# The app is created once in the master (preload_app) and shared with the
+# workers copy-on-write. create_app() opens no database connections and
+# starts no threads, so forking after it is safe; each worker starts its own
+# background job worker in post_fork.
+import os
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get("GUNICORN_WORKERS", 3))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 2))
+timeout = 60
+preload_app = True
+
+
+def post_fork(server, worker):
+    from jobs import start_worker
+
+    start_worker(worker.app.wsgi())
@@ -0,0 +1,391 @@
+"""Local background jobs backed by the ``job`` table.
+
+Long-running work (imports, bulk exports, bulk updates) is recorded as a
+``Job`` row and executed by a small process pool that runs next to the web
+app, so no external broker is needed. Every gunicorn worker starts its own
+``JobWorker``; jobs are claimed with a conditional UPDATE so each one runs
+exactly once.
+
+Periodic work is registered with ``schedule_job``: the worker queues the job
+again once the configured interval has passed since the last one was
+created. Workers in different processes may occasionally both queue it, so
+scheduled handlers must tolerate running concurrently.
+
+A running job records its ``owner`` (host:pid of the dispatching worker)
+and a ``heartbeat_at`` that the owner's loop and ``JobContext.progress``
+keep fresh. A job whose heartbeat is older than ``JOB_HEARTBEAT_TIMEOUT``
+lost its process (restart, OOM kill) and is failed by whichever worker
+notices first.
+"""
+import json
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Job, JobStatus
+
+JOB_HANDLERS = {}
+SCHEDULED_JOBS = {}  # kind -> config key holding the interval in hours
+
+FINISHED_STATUSES = (
+    JobStatus.SUCCEEDED.value,
+    JobStatus.FAILED.value,
+    JobStatus.CANCELLED.value,
+)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_handler(kind):
+    """Register ``func(ctx)`` as the handler for jobs of ``kind``."""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def schedule_job(kind, interval_setting):
+    """Queue ``kind`` every ``app.config[interval_setting]`` hours (0 disables)."""
+    SCHEDULED_JOBS[kind] = interval_setting
+
+
+class JobContext:
+    """Passed to handlers; exposes the payload and progress reporting."""
+
+    def __init__(self, job):
+        self.job = job
+        self.payload = json.loads(job.payload) if job.payload else {}
+
+    def progress(self, done, total=None):
+        # Commits the handler's pending work together with the progress
+        # counters, then checks whether cancellation was requested.
+        self.job.progress_done = done
+        self.job.heartbeat_at = datetime.utcnow()
+        if total is not None:
+            self.job.progress_total = total
+        db.session.commit()
+        if self.job.cancel_requested:
+            raise JobCancelled()
+
+
+def submit_job(kind, payload=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, payload=json.dumps(payload or {}), status=JobStatus.QUEUED.value)
+    db.session.add(job)
+    db.session.commit()
+    if _worker is not None and _worker_pid == os.getpid():
+        _worker.wake()
+    return job
+
+
+def cancel_job(job):
+    """Cancel a queued job immediately, or flag a running one to stop at its next progress report.
+
+    A running job whose owner stopped sending heartbeats will never see
+    the flag, so it is cancelled immediately as well. Both cases use a
+    conditional UPDATE, like the claim in ``JobWorker._dispatch``, so a job
+    claimed in the meantime is flagged instead of overwritten.
+    """
+    finished = {'status': JobStatus.CANCELLED.value, 'finished_at': datetime.utcnow()}
+    cancelled = Job.query.filter_by(id=job.id, status=JobStatus.QUEUED.value).update(
+        finished, synchronize_session=False
+    )
+    if not cancelled:
+        cancelled = Job.query.filter(Job.id == job.id, _abandoned()).update(
+            finished, synchronize_session=False
+        )
+    db.session.commit()
+    db.session.refresh(job)
+    if cancelled:
+        _remove_upload(job)
+    elif job.status == JobStatus.RUNNING.value:
+        job.cancel_requested = True
+        db.session.commit()
+
+
+def _heartbeat_cutoff():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['JOB_HEARTBEAT_TIMEOUT'])
+
+
+def _abandoned():
+    """Filter for running jobs whose owner stopped sending heartbeats."""
+    # Jobs claimed before heartbeats existed only have started_at
+    return db.and_(
+        Job.status == JobStatus.RUNNING.value,
+        db.func.coalesce(Job.heartbeat_at, Job.started_at) < _heartbeat_cutoff()
+    )
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress_done": job.progress_done or 0,
+        "progress_total": job.progress_total,
+        "cancel_requested": bool(job.cancel_requested),
+        "owner": job.owner or "",
+        "heartbeat_at": job.heartbeat_at.isoformat() if job.heartbeat_at else "",
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error or "",
+        "created_at": job.created_at.isoformat() if job.created_at else "",
+        "started_at": job.started_at.isoformat() if job.started_at else "",
+        "finished_at": job.finished_at.isoformat() if job.finished_at else ""
+    }
+
+
+_job_app = None
+
+
+def _get_job_app(config):
+    global _job_app
+    if _job_app is None:
+        from app import create_app
+        _job_app = create_app(config)
+    return _job_app
+
+
+def _child_config(app):
+    # Only plain values are sent to pool processes; everything else is
+    # rebuilt by create_app() there.
+    return {
+        key: value for key, value in app.config.items()
+        if isinstance(value, (str, int, float, bool)) and key.isupper()
+    }
+
+
+def run_job(job_id, config=None):
+    """Entry point executed inside a pool process."""
+    app = _get_job_app(config)
+
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        if job is None:
+            return
+        handler = JOB_HANDLERS.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            result = handler(JobContext(job))
+        except JobCancelled:
+            db.session.rollback()
+            _finish(job, JobStatus.CANCELLED)
+        except Exception as e:
+            db.session.rollback()
+            _finish(job, JobStatus.FAILED, error=str(e))
+        else:
+            _finish(job, JobStatus.SUCCEEDED, result=result)
+        finally:
+            db.session.remove()
+
+
+def _finish(job, status, result=None, error=None):
+    job.status = status.value
+    job.result = json.dumps(result) if result is not None else None
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+
+
+def _remove_upload(job):
+    """Delete the uploaded input a job's handler would have removed itself.
+
+    Jobs that are cancelled before running, or whose process died, never
+    reach the handler's cleanup.
+    """
+    payload = json.loads(job.payload) if job.payload else {}
+    path = payload.get('path')
+    if not path:
+        return
+    folder = os.path.abspath(current_app.config['JOB_FOLDER'])
+    path = os.path.abspath(path)
+    if os.path.dirname(path) == folder and os.path.exists(path):
+        os.remove(path)
+
+
+def _result_file(job):
+    result = json.loads(job.result) if job.result else {}
+    return result.get('file')
+
+
+class JobWorker:
+    """Polls the job table and dispatches queued jobs to a process pool."""
+
+    def __init__(self, app):
+        self.app = app
+        self.max_workers = app.config['JOB_WORKERS']
+        self.poll_interval = app.config['JOB_POLL_INTERVAL']
+        self.retention = timedelta(hours=app.config['JOB_RETENTION_HOURS'])
+        self.max_retained = app.config['JOB_MAX_RETAINED']
+        self.child_config = _child_config(app)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.executor = self._new_executor()
+        self._in_flight = {}  # future -> job id
+        self._crashed = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='job-worker', daemon=True)
+
+    def _new_executor(self):
+        # spawn rather than fork: the parent is multi-threaded (gunicorn
+        # gthread workers plus this dispatcher thread).
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self._heartbeat()
+                    self._reap()
+                    self._schedule()
+                    self._dispatch()
+                    self._prune()
+                    db.session.remove()
+            except Exception as e:
+                self.app.logger.exception("Job worker iteration failed: %s", e)
+
+    def _dispatch(self):
+        with self._lock:
+            free = self.max_workers - len(self._in_flight)
+        if free <= 0:
+            return
+        queued = (
+            db.session.query(Job.id)
+            .filter_by(status=JobStatus.QUEUED.value)
+            .order_by(Job.id)
+            .limit(free)
+            .all()
+        )
+        for (job_id,) in queued:
+            now = datetime.utcnow()
+            claimed = Job.query.filter_by(id=job_id, status=JobStatus.QUEUED.value).update(
+                {'status': JobStatus.RUNNING.value, 'started_at': now, 'owner': self.owner, 'heartbeat_at': now},
+                synchronize_session=False
+            )
+            db.session.commit()
+            if not claimed:
+                continue  # picked up by another worker or cancelled meanwhile
+            try:
+                future = self.executor.submit(run_job, job_id, self.child_config)
+            except Exception as e:
+                _finish(db.session.get(Job, job_id), JobStatus.FAILED, error=str(e))
+                continue
+            with self._lock:
+                self._in_flight[future] = job_id
+            future.add_done_callback(self._on_done)
+
+    def _schedule(self):
+        for kind, interval_setting in SCHEDULED_JOBS.items():
+            interval = self.app.config[interval_setting]
+            if not interval:
+                continue
+            latest = db.session.query(db.func.max(Job.created_at)).filter_by(kind=kind).scalar()
+            if latest is None or latest < datetime.utcnow() - timedelta(hours=interval):
+                submit_job(kind)
+
+    def _on_done(self, future):
+        with self._lock:
+            job_id = self._in_flight.pop(future, None)
+            if future.exception() is not None:
+                # run_job records its own failures, so this only happens
+                # when the pool process itself died.
+                self._crashed.append((job_id, future.exception()))
+        self.wake()
+
+    def _heartbeat(self):
+        with self._lock:
+            running = list(self._in_flight.values())
+        if running:
+            Job.query.filter(Job.id.in_(running), Job.status == JobStatus.RUNNING.value).update(
+                {'heartbeat_at': datetime.utcnow()}, synchronize_session=False
+            )
+            db.session.commit()
+
+    def _reap(self):
+        with self._lock:
+            crashed, self._crashed = self._crashed, []
+            running = set(self._in_flight.values())
+        for job_id, exc in crashed:
+            job = db.session.get(Job, job_id)
+            if job is not None and job.status == JobStatus.RUNNING.value:
+                _finish(job, JobStatus.FAILED, error=f"Worker process failed: {exc!r}")
+                _remove_upload(job)
+            if isinstance(exc, BrokenProcessPool):
+                self.executor.shutdown(wait=False)
+                self.executor = self._new_executor()
+
+        # Jobs whose owning process is gone; the conditional update keeps two
+        # workers from failing the same job twice.
+        for job in Job.query.filter(_abandoned()).all():
+            if job.id in running:
+                continue
+            failed = Job.query.filter_by(id=job.id, status=JobStatus.RUNNING.value).update(
+                {
+                    'status': JobStatus.FAILED.value,
+                    'error': f"Worker {job.owner or 'process'} stopped responding",
+                    'finished_at': datetime.utcnow()
+                },
+                synchronize_session=False
+            )
+            if failed:
+                _remove_upload(job)
+        db.session.commit()
+
+    def _prune(self):
+        finished = Job.query.filter(Job.status.in_(FINISHED_STATUSES))
+        expired = finished.filter(Job.finished_at < datetime.utcnow() - self.retention).all()
+        overflow = finished.order_by(Job.finished_at.desc()).offset(self.max_retained).all()
+        stale = {job.id: job for job in expired + overflow}
+        for job in stale.values():
+            filename = _result_file(job)
+            if filename:
+                path = os.path.join(self.app.config['EXPORT_FOLDER'], filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            _remove_upload(job)
+            db.session.delete(job)
+        if stale:
+            db.session.commit()
+
+
+_worker = None
+_worker_pid = None
+_start_lock = threading.Lock()
+
+
+def start_worker(app):
+    """Start the job worker for this process (no-op inside pool processes).
+
+    Safe to call repeatedly; a worker inherited through fork is replaced.
+    """
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid():
+        return _worker
+    if multiprocessing.parent_process() is not None or not app.config['JOB_WORKER_ENABLED']:
+        return None
+    with _start_lock:
+        if _worker is None or _worker_pid != os.getpid():
+            _worker = JobWorker(app)
+            _worker_pid = os.getpid()
+            _worker.start()
+    return _worker
@@ -18,6 +18,13 @@ class Priority(enum.Enum):
     MEDIUM = "Medium"
     LOW = "Low"
 
+class JobStatus(enum.Enum):
+    QUEUED = "Queued"
+    RUNNING = "Running"
+    SUCCEEDED = "Succeeded"
+    FAILED = "Failed"
+    CANCELLED = "Cancelled"
+
 class TestCase(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -31,18 +38,21 @@ class TestCase(db.Model):
     tags = db.Column(db.String(500), nullable=True)  # Comma-separated tags
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    template_id = db.Column(db.Integer, db.ForeignKey('test_case_template.id'), nullable=True)
-    related_to = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('test_case_template.id', ondelete='SET NULL'), nullable=True)
+    related_to = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='SET NULL'), nullable=True, index=True)
     
-    steps = db.relationship('Step', backref='test_case', cascade="all, delete-orphan", order_by='Step.order')
-    comments = db.relationship('TestCaseComment', backref='test_case', cascade="all, delete-orphan")
-    attachments = db.relationship('Attachment', backref='test_case', cascade="all, delete-orphan")
-    versions = db.relationship('TestCaseVersion', backref='test_case', cascade="all, delete-orphan")
-    test_runs = db.relationship('TestCaseExecution', backref='test_case', cascade="all, delete-orphan")
+    # Children are removed by ON DELETE CASCADE; passive_deletes keeps
+    # SQLAlchemy from loading them just to delete them row by row.
+    steps = db.relationship('Step', backref='test_case', cascade="all, delete-orphan", passive_deletes=True, order_by='Step.order')
+    comments = db.relationship('TestCaseComment', backref='test_case', cascade="all, delete-orphan", passive_deletes=True)
+    attachments = db.relationship('Attachment', backref='test_case', cascade="all, delete-orphan", passive_deletes=True)
+    versions = db.relationship('TestCaseVersion', backref='test_case', cascade="all, delete-orphan", passive_deletes=True)
+    test_runs = db.relationship('TestCaseExecution', backref='test_case', cascade="all, delete-orphan", passive_deletes=True)
+    execution_summaries = db.relationship('ExecutionDailySummary', backref='test_case', cascade="all, delete-orphan", passive_deletes=True)
 
 class Step(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=False)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False)
     description = db.Column(db.Text, nullable=False)
     expected_result = db.Column(db.Text, nullable=False)
     actual_result = db.Column(db.Text, nullable=True)
@@ -51,14 +61,14 @@ class Step(db.Model):
 
 class TestCaseComment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=False)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False)
     comment = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Attachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=True)
-    step_id = db.Column(db.Integer, db.ForeignKey('step.id'), nullable=True)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=True)
+    step_id = db.Column(db.Integer, db.ForeignKey('step.id', ondelete='SET NULL'), nullable=True)
     filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_type = db.Column(db.String(50), nullable=True)
@@ -73,12 +83,12 @@ class TestCaseTemplate(db.Model):
     category = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    template_steps = db.relationship('TemplateStep', backref='template', cascade="all, delete-orphan")
-    test_cases = db.relationship('TestCase', backref='template', lazy=True)
+    template_steps = db.relationship('TemplateStep', backref='template', cascade="all, delete-orphan", passive_deletes=True)
+    test_cases = db.relationship('TestCase', backref='template', lazy=True, passive_deletes=True)
 
 class TemplateStep(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    template_id = db.Column(db.Integer, db.ForeignKey('test_case_template.id'), nullable=False)
+    template_id = db.Column(db.Integer, db.ForeignKey('test_case_template.id', ondelete='CASCADE'), nullable=False)
     description = db.Column(db.Text, nullable=False)
     expected_result = db.Column(db.Text, nullable=False)
     order = db.Column(db.Integer, default=0)
@@ -89,19 +99,42 @@ class TestRun(db.Model):
     description = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    executions = db.relationship('TestCaseExecution', backref='test_run', cascade="all, delete-orphan")
+    executions = db.relationship('TestCaseExecution', backref='test_run', cascade="all, delete-orphan", passive_deletes=True)
 
 class TestCaseExecution(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=False)
-    test_run_id = db.Column(db.Integer, db.ForeignKey('test_run.id'), nullable=True)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False)
+    test_run_id = db.Column(db.Integer, db.ForeignKey('test_run.id', ondelete='CASCADE'), nullable=True)
     status = db.Column(db.String(20), default=TestStatus.NOT_RUN.value)
-    executed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    executed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     notes = db.Column(db.Text, nullable=True)
 
+class ExecutionDailySummary(db.Model):
+    # Per-case, per-day status counts of executions moved to the archive
+    __table_args__ = (db.UniqueConstraint('test_case_id', 'day'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    total = db.Column(db.Integer, default=0)
+    passed = db.Column(db.Integer, default=0)
+    failed = db.Column(db.Integer, default=0)
+    blocked = db.Column(db.Integer, default=0)
+    skipped = db.Column(db.Integer, default=0)
+    not_run = db.Column(db.Integer, default=0)
+
+class ExecutionArchive(db.Model):
+    # One row per archive file segment written for a (day, test run)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    test_run_id = db.Column(db.Integer, nullable=True, index=True)  # Run may be deleted later
+    path = db.Column(db.String(500), nullable=False)  # Relative to ARCHIVE_FOLDER
+    row_count = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class TestCaseVersion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id'), nullable=False)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), nullable=False, index=True)
     version_number = db.Column(db.Integer, nullable=False)
     name = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -110,11 +143,51 @@ class TestCaseVersion(db.Model):
     comment = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    version_steps = db.relationship('VersionStep', backref='version', cascade="all, delete-orphan")
+    version_steps = db.relationship('VersionStep', backref='version', cascade="all, delete-orphan", passive_deletes=True)
 
 class VersionStep(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    version_id = db.Column(db.Integer, db.ForeignKey('test_case_version.id'), nullable=False)
+    version_id = db.Column(db.Integer, db.ForeignKey('test_case_version.id', ondelete='CASCADE'), nullable=False, index=True)
     description = db.Column(db.Text, nullable=False)
     expected_result = db.Column(db.Text, nullable=False)
     order = db.Column(db.Integer, default=0)
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), default=JobStatus.QUEUED.value, index=True)
+    payload = db.Column(db.Text, nullable=True)  # JSON
+    result = db.Column(db.Text, nullable=True)  # JSON
+    error = db.Column(db.Text, nullable=True)
+    progress_done = db.Column(db.Integer, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    owner = db.Column(db.String(100), nullable=True)  # host:pid of the worker running it
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class TestCaseSignature(db.Model):
+    # MinHash signature over a case's name, description and step text
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), primary_key=True)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class TestCaseLshBucket(db.Model):
+    # LSH index: one bucket per (case, band) of its signature
+    __table_args__ = (db.Index('ix_test_case_lsh_bucket_band_bucket', 'band', 'bucket'),)
+    
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+class ChangeLog(db.Model):
+    # Append-only feed of entity changes; the id is the client's cursor
+    __table_args__ = {'sqlite_autoincrement': True}  # Never reuse ids, even after pruning
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,185 @@
+"""Related-case graph built on ``TestCase.related_to``.
+
+``related_to`` points from a case to its parent, so a case's ancestors are
+reached by following it upwards and its descendants by following it in
+reverse. ``walk_related`` does both in a single recursive CTE; the path
+column guards against cycles, which nothing in the schema prevents.
+
+Subtree walks are cached per process for ``GRAPH_CACHE_TTL`` seconds, at
+most ``GRAPH_CACHE_SIZE`` of them, and dropped whenever a route changes
+``related_to`` (see ``invalidate``). The TTL bounds staleness in other
+gunicorn workers.
+"""
+from sqlalchemy import String, Text, and_, case, cast, func, literal, or_, select
+
+from cache import TTLCache
+from models import db, TestCase, TestCaseExecution, ExecutionDailySummary, TestStatus
+
+DIRECTIONS = ('both', 'up', 'down')
+
+_cache = TTLCache('GRAPH_CACHE_TTL', 'GRAPH_CACHE_SIZE')
+
+
+def invalidate():
+    _cache.clear()
+
+
+def _id_marker(column):
+    return literal(',') + cast(column, String) + literal(',')
+
+
+def walk_related(root_id, max_depth, direction='both'):
+    """Return ``[(id, parent_id, depth, direction), ...]`` reachable from ``root_id``.
+
+    ``direction`` limits the walk to ancestors ('up'), descendants ('down')
+    or both. Each case appears once, at its shallowest depth.
+    """
+    tc = TestCase.__table__
+    start = {'both': 'root', 'up': 'up', 'down': 'down'}[direction]
+
+    walk = (
+        select(
+            tc.c.id,
+            tc.c.related_to.label('parent_id'),
+            literal(0).label('depth'),
+            cast(literal(start), Text).label('direction'),
+            cast(_id_marker(tc.c.id), Text).label('path')
+        )
+        .where(tc.c.id == root_id)
+        .cte('walk', recursive=True)
+    )
+    nxt = tc.alias('nxt')
+    walk = walk.union_all(
+        select(
+            nxt.c.id,
+            nxt.c.related_to,
+            walk.c.depth + 1,
+            # PostgreSQL requires both terms to produce identical column types
+            cast(case((nxt.c.related_to == walk.c.id, 'down'), else_='up'), Text),
+            cast(walk.c.path + cast(nxt.c.id, String) + literal(','), Text)
+        )
+        .select_from(walk.join(nxt, or_(
+            and_(walk.c.direction.in_(('root', 'down')), nxt.c.related_to == walk.c.id),
+            and_(walk.c.direction.in_(('root', 'up')), nxt.c.id == walk.c.parent_id)
+        )))
+        .where(walk.c.depth < max_depth, ~walk.c.path.contains(_id_marker(nxt.c.id)))
+    )
+    rows = db.session.execute(
+        select(walk.c.id, walk.c.parent_id, walk.c.depth, walk.c.direction)
+        .order_by(walk.c.depth, walk.c.id)
+    ).all()
+
+    seen = set()
+    nodes = []
+    for row in rows:
+        if row.id in seen:
+            continue
+        seen.add(row.id)
+        nodes.append((row.id, row.parent_id, row.depth, 'root' if row.depth == 0 else row.direction))
+    return nodes
+
+
+def related_graph(root_id, max_depth, direction='both'):
+    nodes = _cache.get(('graph', root_id, max_depth, direction),
+                    lambda: walk_related(root_id, max_depth, direction))
+    ids = [node[0] for node in nodes]
+    cases = dict(
+        (row.id, row) for row in
+        db.session.query(TestCase.id, TestCase.name, TestCase.status, TestCase.priority)
+        .filter(TestCase.id.in_(ids))
+    )
+    in_graph = set(ids)
+    return {
+        "root": root_id,
+        "depth": max_depth,
+        "direction": direction,
+        "nodes": [
+            {
+                "id": node_id,
+                "name": cases[node_id].name,
+                "status": cases[node_id].status,
+                "priority": cases[node_id].priority,
+                "related_to": parent_id,
+                "depth": depth,
+                "direction": node_direction
+            }
+            for node_id, parent_id, depth, node_direction in nodes if node_id in cases
+        ],
+        "edges": [
+            {"from": parent_id, "to": node_id}
+            for node_id, parent_id, _, _ in nodes
+            if parent_id is not None and parent_id in in_graph
+        ]
+    }
+
+
+def latest_executions(case_ids):
+    """Return ``{test_case_id: (status, executed_at)}`` for each case's latest execution."""
+    ranked = (
+        select(
+            TestCaseExecution.test_case_id,
+            TestCaseExecution.status,
+            TestCaseExecution.executed_at,
+            func.row_number().over(
+                partition_by=TestCaseExecution.test_case_id,
+                order_by=(TestCaseExecution.executed_at.desc(), TestCaseExecution.id.desc())
+            ).label('rank')
+        )
+        .where(TestCaseExecution.test_case_id.in_(case_ids))
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(ranked.c.test_case_id, ranked.c.status, ranked.c.executed_at).where(ranked.c.rank == 1)
+    )
+    return {row.test_case_id: (row.status, row.executed_at) for row in rows}
+
+
+def archived_latest(case_ids):
+    """Return ``{test_case_id: (status, last_day)}`` for cases with archived executions.
+
+    Daily summaries do not keep the order of executions within a day, so
+    the status is the case's own, which ``update_execution`` sets from its
+    latest execution.
+    """
+    rows = (
+        db.session.query(TestCase.id, TestCase.status, func.max(ExecutionDailySummary.day))
+        .join(ExecutionDailySummary, ExecutionDailySummary.test_case_id == TestCase.id)
+        .filter(TestCase.id.in_(case_ids))
+        .group_by(TestCase.id, TestCase.status)
+    )
+    return {case_id: (status, last_day) for case_id, status, last_day in rows}
+
+
+def impact(root_id, max_depth):
+    """Roll up the latest execution status of ``root_id`` and its descendants."""
+    nodes = _cache.get(('graph', root_id, max_depth, 'down'),
+                    lambda: walk_related(root_id, max_depth, 'down'))
+    ids = [node[0] for node in nodes]
+    names = dict(db.session.query(TestCase.id, TestCase.name).filter(TestCase.id.in_(ids)))
+    latest = latest_executions(ids)
+    # Cases whose executions were all archived would otherwise read "Not Run"
+    archived = archived_latest([node_id for node_id in ids if node_id not in latest])
+
+    status_counts = {status.value: 0 for status in TestStatus}
+    cases = []
+    for node_id, parent_id, depth, _ in nodes:
+        if node_id not in names:
+            continue
+        status, executed_at = latest.get(node_id) or archived.get(node_id) or (TestStatus.NOT_RUN.value, None)
+        status_counts[status] = status_counts.get(status, 0) + 1
+        cases.append({
+            "id": node_id,
+            "name": names[node_id],
+            "related_to": parent_id,
+            "depth": depth,
+            "latest_status": status,
+            "executed_at": executed_at.isoformat() if executed_at else "",
+            "archived": node_id in archived
+        })
+    return {
+        "root": root_id,
+        "depth": max_depth,
+        "case_count": len(cases),
+        "status_counts": status_counts,
+        "cases": cases
+    }
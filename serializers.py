@@ -0,0 +1,278 @@
+"""Response serialization for the read-heavy API routes.
+
+Each model gets a ``Projection``: the exact columns a response needs plus
+per-column converters, computed once at import time. List endpoints select
+those columns directly instead of hydrating ORM objects, and child rows
+(steps, version steps) are fetched with one query per response rather than
+one per parent.
+
+Encoding uses orjson and, when the client sends ``Accept: application/msgpack``,
+MessagePack. Bodies above ``COMPRESS_MIN_SIZE`` are compressed with brotli
+or gzip depending on ``Accept-Encoding``. orjson, msgpack and brotli are
+optional; without them the stdlib json/gzip paths are used.
+"""
+import gzip
+import json
+
+from flask import Response, current_app, request
+from sqlalchemy import func
+
+from models import (
+    db, TestCase, Step, TestCaseComment, Attachment, TestCaseTemplate,
+    TemplateStep, TestRun, TestCaseExecution, TestCaseVersion, VersionStep,
+    ExecutionArchive
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def _text(value):
+    return value or ""
+
+
+def _iso(value):
+    return value.isoformat() if value else ""
+
+
+class Projection:
+    """Precomputed column list and converters for one model's response shape."""
+
+    def __init__(self, *fields):
+        self.columns = []
+        self.converters = []
+        for field in fields:
+            column, converter = field if isinstance(field, tuple) else (field, None)
+            self.columns.append(column)
+            if converter is not None:
+                self.converters.append((column.key, converter))
+        self.keys = tuple(column.key for column in self.columns)
+
+    def from_row(self, row):
+        data = dict(zip(self.keys, row))
+        for key, converter in self.converters:
+            data[key] = converter(data[key])
+        return data
+
+    def from_object(self, obj):
+        return self.from_row([getattr(obj, key) for key in self.keys])
+
+    def all(self, query):
+        return [self.from_row(row) for row in query.with_entities(*self.columns)]
+
+
+TEST_CASE = Projection(
+    TestCase.id, TestCase.name, TestCase.description,
+    (TestCase.precondition, _text), (TestCase.postcondition, _text),
+    (TestCase.comment, _text), TestCase.status, TestCase.priority,
+    (TestCase.category, _text), (TestCase.tags, _text),
+    (TestCase.created_at, _iso), (TestCase.updated_at, _iso),
+    TestCase.related_to
+)
+RUN_TEST_CASE = Projection(
+    TestCase.id, TestCase.name, TestCase.description,
+    (TestCase.precondition, _text), (TestCase.postcondition, _text),
+    (TestCase.category, _text), TestCase.priority
+)
+STEP = Projection(
+    Step.id, Step.description, Step.expected_result,
+    (Step.actual_result, _text), Step.order
+)
+COMMENT = Projection(
+    TestCaseComment.id, TestCaseComment.comment, (TestCaseComment.created_at, _iso)
+)
+ATTACHMENT = Projection(
+    Attachment.id, Attachment.filename, Attachment.file_type, (Attachment.created_at, _iso)
+)
+TEMPLATE = Projection(
+    TestCaseTemplate.id, TestCaseTemplate.name,
+    (TestCaseTemplate.description, _text), (TestCaseTemplate.precondition, _text),
+    (TestCaseTemplate.postcondition, _text), (TestCaseTemplate.category, _text)
+)
+TEMPLATE_STEP = Projection(
+    TemplateStep.id, TemplateStep.description, TemplateStep.expected_result, TemplateStep.order
+)
+TEST_RUN = Projection(
+    TestRun.id, TestRun.name, (TestRun.description, _text), (TestRun.created_at, _iso)
+)
+EXECUTION = Projection(
+    TestCaseExecution.id, TestCaseExecution.test_case_id, TestCaseExecution.status,
+    (TestCaseExecution.executed_at, _iso), (TestCaseExecution.notes, _text)
+)
+VERSION = Projection(
+    TestCaseVersion.id, TestCaseVersion.version_number, TestCaseVersion.name,
+    (TestCaseVersion.created_at, _iso)
+)
+VERSION_STEP = Projection(
+    VersionStep.id, VersionStep.description, VersionStep.expected_result, VersionStep.order
+)
+
+
+def group_children(projection, parent_column, parent_ids, order_column):
+    """Return ``{parent_id: [child dict, ...]}`` using a single query.
+
+    ``parent_ids`` may be a list or a subquery selecting the parent ids.
+    """
+    grouped = {}
+    rows = (
+        db.session.query(parent_column, *projection.columns)
+        .filter(parent_column.in_(parent_ids))
+        .order_by(parent_column, order_column)
+    )
+    for row in rows:
+        grouped.setdefault(row[0], []).append(projection.from_row(row[1:]))
+    return grouped
+
+
+def count_children(parent_column, parent_ids):
+    return dict(
+        db.session.query(parent_column, func.count())
+        .filter(parent_column.in_(parent_ids))
+        .group_by(parent_column)
+    )
+
+
+# --- Response builders ---
+def test_case_list(query):
+    cases = TEST_CASE.all(query)
+    ids = query.with_entities(TestCase.id).order_by(None).scalar_subquery()
+    steps = group_children(STEP, Step.test_case_id, ids, Step.order)
+    comments = count_children(TestCaseComment.test_case_id, ids)
+    attachments = count_children(Attachment.test_case_id, ids)
+    for tc in cases:
+        tc["steps"] = steps.get(tc["id"], [])
+        tc["comments_count"] = comments.get(tc["id"], 0)
+        tc["attachments_count"] = attachments.get(tc["id"], 0)
+    return cases
+
+
+def test_case_detail(test_case):
+    data = TEST_CASE.from_object(test_case)
+    data["steps"] = [STEP.from_object(step) for step in sorted(test_case.steps, key=lambda s: s.order)]
+    data["comments"] = [COMMENT.from_object(comment) for comment in test_case.comments]
+    data["attachments"] = [ATTACHMENT.from_object(att) for att in test_case.attachments]
+    data["related_cases"] = [
+        {"id": rel_id, "name": rel_name}
+        for rel_id, rel_name in db.session.query(TestCase.id, TestCase.name).filter_by(related_to=test_case.id)
+    ] if test_case.related_to else []
+    return data
+
+
+def test_run_list(query):
+    runs = TEST_RUN.all(query)
+    ids = query.with_entities(TestRun.id).order_by(None).scalar_subquery()
+    counts = count_children(TestCaseExecution.test_run_id, ids)
+    for run in runs:
+        run["executions_count"] = counts.get(run["id"], 0)
+    return runs
+
+
+def test_run_detail(test_run):
+    query = TestCaseExecution.query.filter_by(test_run_id=test_run.id)
+    rows = (
+        query.join(TestCase, TestCaseExecution.test_case_id == TestCase.id)
+        .with_entities(*EXECUTION.columns, *RUN_TEST_CASE.columns)
+        .order_by(TestCaseExecution.id)
+        .all()
+    )
+    case_ids = query.with_entities(TestCaseExecution.test_case_id).scalar_subquery()
+    steps = group_children(STEP, Step.test_case_id, case_ids, Step.order)
+    split = len(EXECUTION.columns)
+    executions = []
+    for row in rows:
+        execution = EXECUTION.from_row(row[:split])
+        test_case = RUN_TEST_CASE.from_row(row[split:])
+        test_case["steps"] = steps.get(test_case["id"], [])
+        execution["test_case_name"] = test_case["name"]
+        execution["test_case"] = test_case
+        executions.append(execution)
+    # Executions moved to cold storage are only listed by /api/testruns/<id>/archive
+    archived = (
+        db.session.query(func.coalesce(func.sum(ExecutionArchive.row_count), 0))
+        .filter(ExecutionArchive.test_run_id == test_run.id)
+        .scalar()
+    )
+    return {
+        "id": test_run.id,
+        "name": test_run.name,
+        "description": test_run.description or "",
+        "created_at": _iso(test_run.created_at),
+        "executions": executions,
+        "archived_executions": archived
+    }
+
+
+def template_list(query):
+    templates = TEMPLATE.all(query)
+    ids = query.with_entities(TestCaseTemplate.id).order_by(None).scalar_subquery()
+    steps = group_children(TEMPLATE_STEP, TemplateStep.template_id, ids, TemplateStep.order)
+    for template in templates:
+        template["steps"] = steps.get(template["id"], [])
+    return templates
+
+
+def version_list(query, include_steps=False):
+    """Versions from ``query`` (which may be paginated) with step counts, and optionally steps."""
+    versions = VERSION.all(query)
+    ids = [version["id"] for version in versions]
+    counts = count_children(VersionStep.version_id, ids)
+    steps = group_children(VERSION_STEP, VersionStep.version_id, ids, VersionStep.order) if include_steps else {}
+    for version in versions:
+        version["steps_count"] = counts.get(version["id"], 0)
+        if include_steps:
+            version["steps"] = steps.get(version["id"], [])
+    return versions
+
+
+# --- Encoding ---
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def _accepts_msgpack():
+    return msgpack is not None and request.accept_mimetypes.best_match(
+        ['application/json', MSGPACK_MIMETYPE]
+    ) == MSGPACK_MIMETYPE
+
+
+def _compress(body):
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return brotli.compress(body, quality=4), 'br'
+    if accepted['gzip']:
+        return gzip.compress(body, compresslevel=5), 'gzip'
+    return body, None
+
+
+def serialize(data, status=200):
+    """Encode ``data`` for the current request (JSON or MessagePack, optionally compressed)."""
+    if _accepts_msgpack():
+        body, mimetype = msgpack.packb(data), MSGPACK_MIMETYPE
+    else:
+        body, mimetype = dumps(data), 'application/json'
+
+    encoding = None
+    if len(body) >= current_app.config['COMPRESS_MIN_SIZE']:
+        body, encoding = _compress(body)
+
+    response = Response(body, status=status, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(('Accept', 'Accept-Encoding'))
+    return response
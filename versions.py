@@ -0,0 +1,94 @@
+"""Server-side diffs between two ``TestCaseVersion`` snapshots.
+
+Fields are compared one by one; steps are aligned with
+``difflib.SequenceMatcher`` so inserted or removed steps show up as such
+instead of shifting every following step into a "change". Versions are
+immutable once written, so computed diffs are kept in a per-process LRU
+cache of ``VERSION_DIFF_CACHE_SIZE`` entries; the long
+``VERSION_DIFF_CACHE_TTL`` only lets memory of unused diffs go.
+"""
+from difflib import SequenceMatcher
+
+from cache import TTLCache
+from models import db, VersionStep
+
+DIFF_FIELDS = ('name', 'description', 'precondition', 'postcondition', 'comment')
+
+_cache = TTLCache('VERSION_DIFF_CACHE_TTL', 'VERSION_DIFF_CACHE_SIZE')
+
+
+def _version_steps(version_id):
+    return [
+        {"description": description, "expected_result": expected_result, "order": order}
+        for description, expected_result, order in
+        db.session.query(VersionStep.description, VersionStep.expected_result, VersionStep.order)
+        .filter_by(version_id=version_id)
+        .order_by(VersionStep.order, VersionStep.id)
+    ]
+
+
+def diff_steps(old_steps, new_steps):
+    """Align two step lists and return a list of edit operations.
+
+    Each operation is ``equal``, ``insert``, ``delete`` or ``change``, with
+    the 0-based positions in the old (``from_index``) and new (``to_index``)
+    lists. A replaced block is reported as pairwise changes, followed by
+    the leftover inserts or deletes when the block sizes differ.
+    """
+    def key(step):
+        return (step["description"], step["expected_result"])
+
+    matcher = SequenceMatcher(None, [key(s) for s in old_steps], [key(s) for s in new_steps], autojunk=False)
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for offset in range(i2 - i1):
+                ops.append({"op": "equal", "from_index": i1 + offset, "to_index": j1 + offset,
+                            "from": old_steps[i1 + offset], "to": new_steps[j1 + offset]})
+            continue
+        paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+        for offset in range(paired):
+            old, new = old_steps[i1 + offset], new_steps[j1 + offset]
+            ops.append({"op": "change", "from_index": i1 + offset, "to_index": j1 + offset,
+                        "from": old, "to": new,
+                        "fields": [field for field in ("description", "expected_result") if old[field] != new[field]]})
+        for i in range(i1 + paired, i2):
+            ops.append({"op": "delete", "from_index": i, "to_index": None, "from": old_steps[i], "to": None})
+        for j in range(j1 + paired, j2):
+            ops.append({"op": "insert", "from_index": None, "to_index": j, "from": None, "to": new_steps[j]})
+    return ops
+
+
+def _compute(old, new):
+    steps = diff_steps(_version_steps(old.id), _version_steps(new.id))
+    fields = [
+        {
+            "field": field,
+            "from": getattr(old, field) or "",
+            "to": getattr(new, field) or "",
+            "changed": (getattr(old, field) or "") != (getattr(new, field) or "")
+        }
+        for field in DIFF_FIELDS
+    ]
+    return {
+        "fields": fields,
+        "steps": steps,
+        "summary": {
+            "fields_changed": sum(1 for f in fields if f["changed"]),
+            "steps_inserted": sum(1 for op in steps if op["op"] == "insert"),
+            "steps_deleted": sum(1 for op in steps if op["op"] == "delete"),
+            "steps_changed": sum(1 for op in steps if op["op"] == "change")
+        }
+    }
+
+
+def diff_versions(old, new):
+    # created_at guards against a deleted version's id being reused
+    key = (old.id, old.created_at, new.id, new.created_at)
+    diff = _cache.get(key, lambda: _compute(old, new))
+    return {
+        "test_case_id": new.test_case_id,
+        "from_version": old.version_number,
+        "to_version": new.version_number,
+        **diff
+    }